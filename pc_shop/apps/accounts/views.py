@@ -7,7 +7,7 @@ from django.shortcuts import redirect, render
 from apps.accounts.forms import CustomUserCreationForm, CustomUserForm, LoginForm
 from apps.accounts.models import Wishlist, WishlistItem
 from apps.configurator.models import Build
-from apps.products.models import Product
+from apps.products.models import Product, main_image_prefetch
 
 
 # --- Аутентификация ---
@@ -99,7 +99,9 @@ def change_password(request):
 @login_required
 def wishlist_view(request):
     wishlist, _ = Wishlist.objects.get_or_create(user=request.user)
-    items = WishlistItem.objects.filter(wishlist=wishlist).select_related('product')
+    items = WishlistItem.objects.filter(wishlist=wishlist).select_related('product').prefetch_related(
+        main_image_prefetch('product__images')
+    )
     return render(request, 'accounts/wishlist.html', {'wishlist_items': items})
 
 
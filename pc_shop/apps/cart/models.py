@@ -1,8 +1,9 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.db.models import Sum, F, Q
 from django.core.exceptions import ValidationError
-from apps.products.models import Product
+from apps.products.models import Product, StockReservation
+from apps.products.stock import release_item, release_reservations, reserve_item
 from apps.orders.models import Order
 
 
@@ -51,31 +52,46 @@ class Cart(models.Model):
         )['total'] or 0
 
     def add_product(self, product, quantity=1):
-        """Добавление с проверкой доступности и резервированием"""
-        if not product.is_available or product.quantity < quantity:
-            raise ValidationError("Product not available in required quantity")
-
-        item, created = self.items.get_or_create(
-            product=product,
-            defaults={'quantity': quantity}
-        )
-
-        if not created:
-            new_quantity = item.quantity + quantity
-            if new_quantity > product.quantity:
-                raise ValidationError("Exceeds available stock")
-            item.quantity = new_quantity
-            item.save()
-
-        product.quantity -= quantity
-        product.save(update_fields=['quantity'])
+        """Добавление с резервированием: остаток не меняется, растет резерв товара (apps.products.stock)"""
+        if quantity < 1:
+            raise ValidationError("Количество должно быть положительным")
+        with transaction.atomic():
+            item, created = self.items.get_or_create(
+                product=product,
+                defaults={'quantity': quantity}
+            )
+            if not created:
+                item.quantity += quantity
+                item.save(update_fields=['quantity'])
+            item.product = product
+            reserve_item(item)
+        return item
+
+    def update_product(self, item, new_quantity):
+        """Новое количество позиции с резервированием разницы"""
+        if new_quantity < 1:
+            raise ValidationError("Количество должно быть положительным")
+        previous = item.quantity
+        try:
+            with transaction.atomic():
+                item.quantity = new_quantity
+                item.save(update_fields=['quantity'])
+                reserve_item(item)
+        except ValidationError:
+            item.quantity = previous
+            raise
+
+    def remove_product(self, item):
+        """Удаление позиции с возвратом резерва"""
+        with transaction.atomic():
+            release_item(item)
+            item.delete()
 
     def release_stock(self):
         """Освобождение резерва при отмене корзины"""
-        for item in self.items.select_related('product'):
-            item.product.quantity += item.quantity
-            item.product.save(update_fields=['quantity'])
-        self.items.all().delete()
+        with transaction.atomic():
+            release_reservations(StockReservation.objects.filter(cart_item__cart=self))
+            self.items.all().delete()
 
     @property
     def is_active(self):
@@ -112,6 +128,15 @@ class CartItem(models.Model):
     def get_cost(self):
         return self.product.price * self.quantity
 
+    def get_available_quantity(self):
+        """Доступно позиции: свободный остаток товара плюс ее собственный резерв,
+        который уже входит в reserved_quantity"""
+        try:
+            own = self.reservation.quantity
+        except StockReservation.DoesNotExist:
+            own = 0
+        return self.product.available_quantity + own
+
     def clean(self):
-        if self.quantity > self.product.quantity:
+        if self.quantity > self.get_available_quantity():
             raise ValidationError("Quantity exceeds available stock")
@@ -1,14 +1,7 @@
 from celery import shared_task
-from django.utils import timezone
-from .models import Cart
+from apps.products.stock import expire_reservations
 
 @shared_task
 def release_abandoned_carts():
-    """Освобождение брони через 1 час неактивности"""
-    expired = timezone.now() - timezone.timedelta(hours=1)
-    carts = Cart.objects.filter(
-        converted_order__isnull=True,
-        updated_at__lt=expired
-    )
-    for cart in carts:
-        cart.release_stock()
\ No newline at end of file
+    """Снятие резервов, срок которых истек (RESERVATION_TTL после изменения позиции)"""
+    return expire_reservations()
\ No newline at end of file
@@ -3,6 +3,7 @@ from django.db import transaction
 from django.utils import timezone
 from apps.cart.models import Cart, CartItem
 from apps.products.models import Product
+from apps.products.stock import InsufficientStock
 
 
 class CartHandler:
@@ -60,7 +61,10 @@ class CartHandler:
         """Атомарное слияние корзин"""
         try:
             with transaction.atomic():
-                for item in source_cart.items.select_related('product').select_for_update():
+                items = list(source_cart.items.select_related('product'))
+                # Резерв гостевой корзины возвращается и берется заново уже в корзине пользователя
+                source_cart.release_stock()
+                for item in items:
                     try:
                         self._cart.add_product(item.product, item.quantity)
                     except ValidationError:
@@ -83,7 +87,7 @@ class CartHandler:
         """Добавление товара с резервированием"""
         try:
             with transaction.atomic():
-                product = Product.objects.select_for_update().get(
+                product = Product.objects.get(
                     pk=product_id,
                     is_available=True
                 )
@@ -95,7 +99,7 @@ class CartHandler:
                 return {
                     'success': True,
                     'new_quantity': self.get_product_quantity(product),
-                    'reserved': product.quantity
+                    'reserved': product.available_quantity
                 }
 
         except (Product.DoesNotExist, ValidationError) as e:
@@ -105,45 +109,27 @@ class CartHandler:
         """Удаление товара с возвратом резерва"""
         try:
             with transaction.atomic():
-                product = Product.objects.select_for_update().get(pk=product_id)
-                item = self.cart.items.select_for_update().get(product=product)
-
-                product.quantity += item.quantity
-                product.save(update_fields=['quantity'])
-
-                item.delete()
+                item = self.cart.items.select_related('product').get(product_id=product_id)
+                self.cart.remove_product(item)
                 return {'success': True}
 
-        except (CartItem.DoesNotExist, Product.DoesNotExist):
+        except CartItem.DoesNotExist:
             return {'error': 'Товар не найден в корзине'}
 
     def update_quantity(self, product_id, new_quantity):
         """Обновление количества с коррекцией резерва"""
         try:
             with transaction.atomic():
-                product = Product.objects.select_for_update().get(
-                    pk=product_id,
-                    is_available=True
-                )
-
-                item = self.cart.items.select_for_update().get(product=product)
-                delta = new_quantity - item.quantity
-
-                if product.quantity < delta:
-                    raise ValidationError(
-                        f"Доступно только {product.quantity + item.quantity} шт."
-                    )
-
-                product.quantity -= delta
-                product.save(update_fields=['quantity'])
-
-                item.quantity = new_quantity
-                item.save()
+                item = self.cart.items.select_related('product').get(product_id=product_id)
+                try:
+                    self.cart.update_product(item, new_quantity)
+                except InsufficientStock as e:
+                    raise ValidationError(f"Доступно только {e.available + item.quantity} шт.")
 
                 return {
                     'success': True,
                     'new_quantity': new_quantity,
-                    'reserved': product.quantity
+                    'reserved': item.product.available_quantity
                 }
 
         except (CartItem.DoesNotExist, ValidationError) as e:
@@ -167,8 +153,8 @@ class CartHandler:
                     'product_id': item.product.id,
                     'quantity': item.quantity,
                     'price': item.product.price,
-                    'available': item.product.quantity + item.quantity
-                } for item in self.cart.items.select_related('product')
+                    'available': item.get_available_quantity()
+                } for item in self.cart.items.select_related('product', 'reservation')
             ]
         }
 
@@ -176,13 +162,14 @@ class CartHandler:
         """Проверка доступности всех товаров"""
         problems = []
         with transaction.atomic():
-            items = self.cart.items.select_related('product').select_for_update()
+            items = self.cart.items.select_related('product', 'reservation')
             for item in items:
-                if item.quantity > (item.product.quantity + item.quantity):
+                available = item.get_available_quantity()
+                if item.quantity > available:
                     problems.append({
                         'product_id': item.product.id,
                         'requested': item.quantity,
-                        'available': item.product.quantity
+                        'available': available
                     })
             return problems
 
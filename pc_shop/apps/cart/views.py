@@ -8,6 +8,7 @@ from django.utils import timezone
 import json
 
 from apps.products.models import Product
+from apps.products.stock import InsufficientStock
 from apps.cart.models import Cart, CartItem
 from apps.orders.models import Order, OrderItem
 from apps.cart.utils import CartHandler
@@ -15,10 +16,10 @@ from apps.cart.utils import CartHandler
 
 @require_POST
 def cart_add(request, product_id):
-    """Добавление товара с резервированием и конкурентным контролем"""
+    """Добавление товара с резервом по журналу StockReservation (apps.products.stock)"""
     try:
         with transaction.atomic():
-            product = Product.objects.select_for_update().get(pk=product_id)
+            product = Product.objects.get(pk=product_id)
             cart = CartHandler(request).cart
 
             if not cart.is_active:
@@ -36,7 +37,7 @@ def cart_add(request, product_id):
             return JsonResponse({
                 'success': True,
                 'total_items': cart.total_items,
-                'reserved': product.quantity,
+                'reserved': product.available_quantity,
                 'cart_total': cart.get_total_price()
             })
 
@@ -46,10 +47,9 @@ def cart_add(request, product_id):
 
 @require_POST
 def cart_update(request, product_id):
-    """Атомарное обновление количества с проверкой резерва"""
+    """Обновление количества с резервированием разницы"""
     try:
         with transaction.atomic():
-            product = Product.objects.select_for_update().get(pk=product_id)
             cart = CartHandler(request).cart
             data = json.loads(request.body)
             new_quantity = int(data['quantity'])
@@ -57,25 +57,23 @@ def cart_update(request, product_id):
             if not cart.is_active:
                 raise PermissionDenied("Корзина завершена")
 
-            item = cart.items.get(product=product)
-            delta = new_quantity - item.quantity
+            item = cart.items.select_related('product').get(product_id=product_id)
 
-            if product.quantity < delta:
+            try:
+                cart.update_product(item, new_quantity)
+            except InsufficientStock as e:
                 return JsonResponse({
-                    'error': f'Доступно только {product.quantity} шт.'
+                    'error': f'Доступно только {e.available + item.quantity} шт.'
                 }, status=400)
-
-            item.quantity = new_quantity
-            item.save()
-            product.quantity -= delta
-            product.save()
+            except ValidationError as e:
+                return JsonResponse({'error': str(e)}, status=400)
 
             return JsonResponse({
                 'success': True,
                 'new_quantity': item.quantity,
                 'item_total': item.get_cost(),
                 'cart_total': cart.get_total_price(),
-                'product_reserved': product.quantity
+                'product_reserved': item.product.available_quantity
             })
 
     except (CartItem.DoesNotExist, KeyError) as e:
@@ -87,22 +85,19 @@ def cart_remove(request, product_id):
     """Удаление с возвратом резерва"""
     try:
         with transaction.atomic():
-            product = Product.objects.select_for_update().get(pk=product_id)
             cart = CartHandler(request).cart
 
             if not cart.is_active:
                 raise PermissionDenied("Корзина завершена")
 
-            item = cart.items.get(product=product)
-            product.quantity += item.quantity
-            product.save()
-            item.delete()
+            item = cart.items.select_related('product').get(product_id=product_id)
+            cart.remove_product(item)
 
             return JsonResponse({
                 'success': True,
                 'cart_total': cart.get_total_price(),
                 'total_items': cart.total_items,
-                'product_restored': product.quantity
+                'product_restored': item.product.available_quantity
             })
 
     except CartItem.DoesNotExist:
@@ -184,11 +179,12 @@ def cart_validate(request):
     cart = CartHandler(request).cart
     problems = []
 
-    for item in cart.items.select_related('product'):
-        if item.quantity > item.product.quantity:
+    for item in cart.items.select_related('product', 'reservation'):
+        available = item.get_available_quantity()
+        if item.quantity > available:
             problems.append({
                 'product': item.product.name,
-                'available': item.product.quantity,
+                'available': available,
                 'requested': item.quantity
             })
 
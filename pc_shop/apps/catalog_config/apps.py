@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class CatalogConfigConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.catalog_config'
+
+    def ready(self):
+        import apps.catalog_config.signals
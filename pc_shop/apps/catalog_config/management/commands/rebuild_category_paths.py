@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.catalog_config.tree import rebuild_category_paths
+from apps.products.models import Product
+from apps.products.search import update_search_vector
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает пути всех категорий (например, после импорта или перемещения узлов)"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            changed = rebuild_category_paths()
+            # bulk_update не отправляет сигналы: поисковые документы обновляем явно
+            if changed:
+                update_search_vector(Product.objects.filter(category_id__in=changed).values('pk'))
+
+        self.stdout.write(self.style.SUCCESS(f"Обновлено путей: {len(changed)}"))
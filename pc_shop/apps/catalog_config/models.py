@@ -1,10 +1,11 @@
 from django.db import models
+from django.contrib.postgres.indexes import GinIndex
 from django.core.exceptions import ValidationError
-from django.db.models.signals import post_save, post_delete
-from django.dispatch import receiver
 from mptt.models import MPTTModel, TreeForeignKey
 from django.utils.translation import gettext_lazy as _
-from django.db.models import Q
+
+
+PATH_SEPARATOR = ' > '
 
 
 class Category(MPTTModel):
@@ -23,6 +24,9 @@ class Category(MPTTModel):
     class Meta:
         verbose_name = _("Категория")
         verbose_name_plural = _("Категории")
+        indexes = [
+            GinIndex(fields=['name'], name='category_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ]
 
     class MPTTMeta:
         order_insertion_by = ['name']
@@ -31,28 +35,18 @@ class Category(MPTTModel):
         return self.name
 
     def save(self, *args, **kwargs):
-        if not self.pk:
-            super().save(*args, **kwargs)
-
-        ancestors = self.get_ancestors(include_self=True)
-        self.path = ' > '.join(ancestor.name for ancestor in ancestors)
+        # Путь родителя уже материализован: одно сохранение без обхода предков
+        self.path = self.build_path(self.parent.path if self.parent_id else '')
         super().save(*args, **kwargs)
 
+    def build_path(self, parent_path):
+        return f"{parent_path}{PATH_SEPARATOR}{self.name}" if parent_path else self.name
+
     def get_all_attributes(self):
+        # Для чтения схемы без запросов - apps.catalog_config.schema.get_category_schema
         return Attribute.objects.filter(
-            Q(groups__group__category=self) | Q(groups__group__category__in=self.get_descendants())
-        ).prefetch_related(
-            'groups__group__category',
-            'enum_options'
-        ).distinct()
-
-
-@receiver([post_save, post_delete], sender=Category)
-def update_descendants_path(sender, instance, **kwargs):
-    if kwargs.get('update_fields') and 'path' in kwargs['update_fields']:
-        return
-    for descendant in instance.get_descendants():
-        descendant.save(update_fields=['path'])
+            groups__category__in=self.get_descendants(include_self=True)
+        ).prefetch_related('enum_options').distinct()
 
 
 class AttributeGroupLink(models.Model):
@@ -0,0 +1,125 @@
+from django.core.cache import cache
+from django.db import transaction
+
+from apps.catalog_config.models import AttributeGroup, AttributeGroupLink, EnumOption
+from apps.catalog_config.tree import get_category_tree
+from apps.core.cache import bump_version, get_version
+
+SCHEMA_NAMESPACE = 'attribute_schema'
+SCHEMA_TIMEOUT = 60 * 60 * 24
+
+# Схемы текущей версии в памяти процесса: {category_id: CategorySchema}
+_local_schemas = {}
+_local_version = None
+
+
+class CategorySchema:
+    """Атрибуты категории и ее подкатегорий в порядке групп.
+
+    Группа - словарь id, name, category_id, category_path, attributes;
+    атрибут - словарь id, name, data_type, unit, is_required, compatibility_critical,
+    validation_regex, options (список пар id, значение), group_ids.
+    """
+
+    def __init__(self, category_id, groups, attributes):
+        self.category_id = category_id
+        self.groups = groups
+        self.attributes = attributes
+        self.by_id = {attribute['id']: attribute for attribute in attributes}
+
+    def get(self, attribute_id):
+        return self.by_id.get(attribute_id)
+
+    @property
+    def attribute_ids(self):
+        return list(self.by_id)
+
+
+def build_category_schema(category_id):
+    """Схема категории тремя запросами: группы, связи с атрибутами, варианты списков"""
+    category_ids = get_category_tree().descendant_ids(category_id)
+
+    groups = [
+        {
+            'id': group['id'],
+            'name': group['name'],
+            'category_id': group['category_id'],
+            'category_path': group['category__path'],
+            'attributes': [],
+        }
+        for group in AttributeGroup.objects.filter(category_id__in=category_ids).order_by(
+            'category__tree_id', 'category__lft', 'tree_id', 'lft'
+        ).values('id', 'name', 'category_id', 'category__path')
+    ]
+    groups_by_id = {group['id']: group for group in groups}
+
+    attributes = {}
+    links = AttributeGroupLink.objects.filter(group_id__in=groups_by_id).order_by(
+        'attribute__tree_id', 'attribute__lft'
+    ).values(
+        'group_id', 'attribute_id', 'attribute__name', 'attribute__data_type', 'attribute__unit',
+        'attribute__is_required', 'attribute__compatibility_critical', 'attribute__validation_regex'
+    )
+    for link in links:
+        attribute = attributes.get(link['attribute_id'])
+        if attribute is None:
+            attribute = attributes[link['attribute_id']] = {
+                'id': link['attribute_id'],
+                'name': link['attribute__name'],
+                'data_type': link['attribute__data_type'],
+                'unit': link['attribute__unit'],
+                'is_required': link['attribute__is_required'],
+                'compatibility_critical': link['attribute__compatibility_critical'],
+                'validation_regex': link['attribute__validation_regex'],
+                'options': [],
+                'group_ids': [],
+            }
+        attribute['group_ids'].append(link['group_id'])
+        groups_by_id[link['group_id']]['attributes'].append(attribute)
+
+    enum_ids = [pk for pk, attribute in attributes.items() if attribute['data_type'] == 'enum']
+    for option_id, attribute_id, value in EnumOption.objects.filter(
+            attribute_id__in=enum_ids
+    ).values_list('id', 'attribute_id', 'value'):
+        attributes[attribute_id]['options'].append((option_id, value))
+
+    return CategorySchema(category_id, groups, list(attributes.values()))
+
+
+def get_category_schema(category_id):
+    """Схема из памяти процесса, затем из общего кэша; строится при смене версии"""
+    global _local_version
+
+    version = get_version(SCHEMA_NAMESPACE)
+    if version != _local_version:
+        _local_schemas.clear()
+        _local_version = version
+
+    schema = _local_schemas.get(category_id)
+    if schema is None:
+        key = f'{SCHEMA_NAMESPACE}:v{version}:{category_id}'
+        schema = cache.get(key)
+        if schema is None:
+            schema = build_category_schema(category_id)
+            cache.set(key, schema, SCHEMA_TIMEOUT)
+        _local_schemas[category_id] = schema
+    return schema
+
+
+def get_branch_groups(category_id):
+    """Группы схемы, действующие для товаров категории: группы ее предков, ее самой
+    и подкатегорий в порядке схемы корневой категории"""
+    tree = get_category_tree()
+    node = tree.get(category_id)
+    if node is None:
+        return []
+    branch = set(tree.descendant_ids(category_id))
+    while node['parent_id'] is not None:
+        node = tree.get(node['parent_id'])
+        branch.add(node['id'])
+    schema = get_category_schema(node['id'])
+    return [group for group in schema.groups if group['category_id'] in branch]
+
+
+def invalidate_schemas():
+    transaction.on_commit(lambda: bump_version(SCHEMA_NAMESPACE))
@@ -0,0 +1,35 @@
+from django.db.models.signals import m2m_changed, post_save, post_delete
+from django.dispatch import receiver
+
+from apps.catalog_config.models import (
+    Attribute, AttributeGroup, AttributeGroupLink, Category, EnumOption
+)
+from apps.catalog_config.schema import invalidate_schemas
+from apps.catalog_config.tree import invalidate_category_tree, rebuild_category_paths
+
+
+@receiver(post_save, sender=Category)
+def update_descendants_path(sender, instance, created=False, **kwargs):
+    if created or instance.is_leaf_node():
+        return
+    rebuild_category_paths(root=instance)
+
+
+@receiver([post_save, post_delete], sender=Category)
+def update_category_tree(sender, instance, **kwargs):
+    invalidate_category_tree()
+
+
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Attribute)
+@receiver([post_save, post_delete], sender=AttributeGroup)
+@receiver([post_save, post_delete], sender=AttributeGroupLink)
+@receiver([post_save, post_delete], sender=EnumOption)
+def update_attribute_schemas(sender, instance, **kwargs):
+    invalidate_schemas()
+
+
+@receiver(m2m_changed, sender=Attribute.groups.through)
+def update_attribute_schemas_on_link(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_schemas()
@@ -0,0 +1,118 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+
+from apps.catalog_config.models import Category
+from apps.core.cache import bump_version, versioned_key
+
+CATEGORY_TREE_NAMESPACE = 'category_tree'
+CATEGORY_TREE_TIMEOUT = 60 * 60 * 24
+
+
+class CategoryTree:
+    """Материализованное дерево категорий.
+
+    Узел - словарь id, slug, name, level, parent_id, product_count (с подкатегориями)
+    и children (список дочерних узлов).
+    """
+
+    def __init__(self, nodes):
+        self.nodes = nodes
+        self.roots = [node for node in nodes.values() if node['parent_id'] is None]
+        self.by_slug = {node['slug']: node for node in nodes.values()}
+
+    def get(self, category_id):
+        return self.nodes.get(category_id)
+
+    def get_by_slug(self, slug):
+        return self.by_slug.get(slug)
+
+    def descendant_ids(self, category_id, include_self=True):
+        node = self.nodes.get(category_id)
+        if node is None:
+            return []
+        ids = [node['id']] if include_self else []
+        stack = list(node['children'])
+        while stack:
+            child = stack.pop()
+            ids.append(child['id'])
+            stack.extend(child['children'])
+        return ids
+
+    def ancestor_ids(self, category_id, include_self=False):
+        """id предков от родителя к корню"""
+        node = self.nodes.get(category_id)
+        ids = [node['id']] if node and include_self else []
+        while node is not None and node['parent_id'] is not None:
+            node = self.nodes.get(node['parent_id'])
+            if node is not None:
+                ids.append(node['id'])
+        return ids
+
+
+def build_category_tree():
+    """Дерево со счетчиками товаров за один запрос"""
+    rows = Category.objects.order_by('tree_id', 'lft').values(
+        'id', 'slug', 'name', 'level', 'parent_id'
+    ).annotate(direct_count=Count('products'))
+
+    nodes = {}
+    for row in rows:
+        node = {
+            'id': row['id'],
+            'slug': row['slug'],
+            'name': row['name'],
+            'level': row['level'],
+            'parent_id': row['parent_id'],
+            'product_count': row['direct_count'],
+            'children': [],
+        }
+        nodes[node['id']] = node
+        # В порядке обхода (tree_id, lft) родитель идет раньше потомков
+        if node['parent_id'] in nodes:
+            nodes[node['parent_id']]['children'].append(node)
+
+    for node in reversed(list(nodes.values())):
+        if node['parent_id'] in nodes:
+            nodes[node['parent_id']]['product_count'] += node['product_count']
+
+    return CategoryTree(nodes)
+
+
+def get_category_tree():
+    key = versioned_key(CATEGORY_TREE_NAMESPACE)
+    tree = cache.get(key)
+    if tree is None:
+        tree = build_category_tree()
+        cache.set(key, tree, CATEGORY_TREE_TIMEOUT)
+    return tree
+
+
+def invalidate_category_tree():
+    """Новая версия ключа после фиксации транзакции; дерево перестроится при следующем чтении"""
+    transaction.on_commit(lambda: bump_version(CATEGORY_TREE_NAMESPACE))
+
+
+def rebuild_category_paths(root=None):
+    """Пересчет материализованных путей одним проходом по дереву (порядок tree_id, lft).
+
+    Без root перестраиваются все категории, иначе - потомки root.
+    Записываются только изменившиеся пути; возвращает id этих категорий.
+    """
+    categories = Category.objects.order_by('tree_id', 'lft').only('id', 'name', 'parent_id', 'path')
+    paths = {}
+    if root is not None:
+        categories = categories.filter(tree_id=root.tree_id, lft__gt=root.lft, rght__lt=root.rght)
+        paths[root.id] = root.path
+
+    changed = []
+    for category in categories:
+        # Родитель предшествует потомкам, его путь уже посчитан
+        path = category.build_path(paths.get(category.parent_id, ''))
+        paths[category.id] = path
+        if category.path != path:
+            category.path = path
+            changed.append(category)
+
+    Category.objects.bulk_update(changed, ['path'], batch_size=1000)
+    return [category.id for category in changed]
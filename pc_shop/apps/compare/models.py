@@ -5,6 +5,7 @@ from django.db.models import Q
 from django.urls import reverse
 from apps.products.models import Product, ProductAttributeValue
 from apps.catalog_config.models import Category
+from apps.catalog_config.schema import get_category_schema
 
 
 
@@ -108,40 +109,42 @@ class Comparison(models.Model):
 
     @property
     def attributes_matrix(self):
-        """Оптимизированная матрица атрибутов с группировкой"""
-        if not self.products.exists():
+        """Матрица атрибутов по группам схемы категории: {(путь, группа): [атрибут со значениями]}"""
+        if not self.category_id:
+            return {}
+        product_ids = list(self.products.values_list('id', flat=True))
+        if not product_ids:
             return {}
 
-        attributes = {}
-        products = self.products.prefetch_related(
-            'attributes__attribute__groups__group__category',
-            'attributes__attribute__enum_options'
-        )
-
-        # Собираем все атрибуты категории
-        category_attrs = self.category.get_all_attributes() if self.category else []
-
-        for attr in category_attrs:
-            for group in attr.groups.all():
-                group_key = (group.group.category.path, group.group.name)
-                attr_key = f"{attr.name} ({attr.unit})" if attr.unit else attr.name
+        schema = get_category_schema(self.category_id)
+        values = {
+            (attribute_id, product_id): value
+            for product_id, attribute_id, value in ProductAttributeValue.objects.filter(
+                product_id__in=product_ids,
+                attribute_id__in=schema.attribute_ids
+            ).values_list('product_id', 'attribute_id', 'value')
+        }
 
-                attributes.setdefault(group_key, {})[attr] = {
-                    product.id: self._get_attribute_value(product, attr)
-                    for product in products
-                }
+        attributes = {}
+        for group in schema.groups:
+            for attr in group['attributes']:
+                attributes.setdefault((group['category_path'], group['name']), []).append({
+                    **attr,
+                    'values': {
+                        product_id: self._format_attribute_value(attr, values.get((attr['id'], product_id)))
+                        for product_id in product_ids
+                    }
+                })
 
         return attributes
 
-    def _get_attribute_value(self, product, attribute):
-        """Получение значения атрибута для продукта"""
-        try:
-            value = product.attributes.get(attribute=attribute).value
-            if attribute.data_type == 'boolean':
-                return "Да" if value else "Нет"
-            return value
-        except ProductAttributeValue.DoesNotExist:
+    def _format_attribute_value(self, attribute, value):
+        """Значение атрибута товара для отображения"""
+        if value is None:
             return "-"
+        if attribute['data_type'] == 'boolean':
+            return "Да" if value else "Нет"
+        return value
 
     def get_absolute_url(self):
         return reverse('compare:detail', kwargs={'pk': self.pk})
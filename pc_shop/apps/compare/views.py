@@ -5,9 +5,14 @@ from django.core.exceptions import ValidationError
 from django.urls import reverse
 from django.contrib.sessions.models import Session
 from django.conf import settings
-from django.db.models import Q
+from django.db.models import Prefetch, Q
 from apps.products.models import Product
+from apps.catalog_config.schema import SCHEMA_NAMESPACE
 from apps.compare.models import Comparison, ComparisonItem
+from apps.core.cache import get_versions
+from apps.core.conditional import conditional_page
+from apps.products.cards import card_namespace
+from apps.products.invalidation import catalog_namespace
 
 
 def _get_current_comparison(request):
@@ -33,10 +38,9 @@ def _get_comparison_for_view(request):
     """Получение сравнения с оптимизированными запросами"""
     q_filter = Q(user=request.user) if request.user.is_authenticated else Q(session_key=request.session.session_key)
 
+    # Атрибуты матрица читает по схеме категории, здесь - только товары с изображениями
     return Comparison.objects.filter(q_filter).prefetch_related(
-        'products__images',
-        'products__attributes__attribute__groups__group__category',
-        'products__category'
+        Prefetch('products', queryset=Product.objects.select_related('category').with_main_image())
     ).first()
 
 
@@ -100,6 +104,24 @@ def remove_from_compare(request, product_id):
         }, status=500)
 
 
+def compare_etag_parts(request):
+    """Состав сравнения и версии его товаров, их атрибутов и схемы"""
+    if request.user.is_authenticated:
+        owner = {'comparison__user': request.user}
+    elif request.session.session_key:
+        owner = {'comparison__session_key': request.session.session_key}
+    else:
+        return None
+    items = sorted(ComparisonItem.objects.filter(**owner).values_list(
+        'comparison_id', 'product_id', 'product__category_id'
+    ))
+    namespaces = [SCHEMA_NAMESPACE]
+    for _, product_id, category_id in items:
+        namespaces += [card_namespace(product_id), catalog_namespace(category_id)]
+    return [request.session.session_key, items, get_versions(namespaces)]
+
+
+@conditional_page(compare_etag_parts)
 def compare_detail(request):
     """Детальная страница сравнения"""
     comparison = _get_comparison_for_view(request)
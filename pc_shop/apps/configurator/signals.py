@@ -0,0 +1,16 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from apps.configurator.models import CompatibilityRule, ComponentType
+from apps.core.cache import bump_version
+
+# Версия правил совместимости: от них зависит результат проверки сборки
+RULES_NAMESPACE = 'configurator_rules'
+
+
+@receiver([post_save, post_delete], sender=CompatibilityRule)
+@receiver([post_save, post_delete], sender=ComponentType)
+@receiver(m2m_changed, sender=ComponentType.compatibility_attributes.through)
+def invalidate_compatibility_rules(sender, **kwargs):
+    transaction.on_commit(lambda: bump_version(RULES_NAMESPACE))
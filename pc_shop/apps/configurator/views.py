@@ -10,6 +10,11 @@ from django.contrib.contenttypes.models import ContentType
 from apps.catalog_config.models import Category
 from apps.products.models import Product
 from apps.configurator.models import Build, BuildComponent, ComponentType, CompatibilityRule
+from apps.configurator.signals import RULES_NAMESPACE
+from apps.core.cache import get_versions
+from apps.core.conditional import conditional_page
+from apps.products.cards import card_namespace
+from apps.products.invalidation import catalog_namespace
 
 
 @login_required
@@ -128,7 +133,24 @@ def get_components_api(request, type_id):
         return JsonResponse({'error': str(e)}, status=400)
 
 
+def build_etag_parts(request, build_id):
+    """Сборка, ее компоненты, их товары и атрибуты, правила совместимости"""
+    if not request.user.is_authenticated:
+        return None
+    build = Build.objects.filter(id=build_id, user=request.user).values('updated_at').first()
+    if build is None:
+        return None
+    components = sorted(BuildComponent.objects.filter(build_id=build_id).values_list(
+        'component_type_id', 'product_id', 'product__category_id'
+    ))
+    namespaces = [RULES_NAMESPACE]
+    for _, product_id, category_id in components:
+        namespaces += [card_namespace(product_id), catalog_namespace(category_id)]
+    return [build['updated_at'], components, get_versions(namespaces)]
+
+
 @login_required
+@conditional_page(build_etag_parts)
 def build_detail(request, build_id):
     """Детализация сборки"""
     build = get_object_or_404(Build, id=build_id, user=request.user)
@@ -0,0 +1,40 @@
+import time
+
+from django.core.cache import cache
+
+VERSION_KEY = 'version:{}'
+
+
+def get_version(namespace):
+    """Текущая версия пространства ключей; при потере ключа начинается с метки времени,
+    чтобы не совпасть с версией устаревших записей"""
+    key = VERSION_KEY.format(namespace)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(namespace):
+    """Инвалидирует все ключи пространства: старые записи истекут по TTL"""
+    key = VERSION_KEY.format(namespace)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        get_version(namespace)
+        return cache.incr(key)
+
+
+def versioned_key(namespace, *parts):
+    return ':'.join([namespace, f'v{get_version(namespace)}', *map(str, parts)])
+
+
+def get_versions(namespaces):
+    """Версии нескольких пространств одним обращением к кэшу: {namespace: версия}"""
+    keys = {VERSION_KEY.format(namespace): namespace for namespace in namespaces}
+    found = cache.get_many(keys)
+    versions = {keys[key]: version for key, version in found.items()}
+    for namespace in set(keys.values()) - set(versions):
+        versions[namespace] = get_version(namespace)
+    return versions
@@ -0,0 +1,39 @@
+import hashlib
+import json
+
+from django.contrib.messages import get_messages
+from django.views.decorators.http import condition
+
+
+def make_etag(*parts):
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def conditional_page(parts_func):
+    """Строгий ETag страницы из частей parts_func(request, *args, **kwargs) и пользователя.
+
+    If-None-Match с совпадающим тегом получает 304 без вызова представления. parts_func
+    возвращает None, если страницу нельзя описать версиями; страницы с непоказанными
+    сообщениями тегом не помечаются.
+    """
+    def etag(request, *args, **kwargs):
+        if len(get_messages(request)):
+            return None
+        parts = parts_func(request, *args, **kwargs)
+        if parts is None:
+            return None
+        return make_etag(request.user.pk, parts)
+
+    return condition(etag_func=etag)
+
+
+class ConditionalPageMixin:
+    """conditional_page для представлений-классов: части тега - get_etag_parts()"""
+
+    def get_etag_parts(self):
+        return None
+
+    def dispatch(self, request, *args, **kwargs):
+        view = conditional_page(lambda request, *args, **kwargs: self.get_etag_parts())(super().dispatch)
+        return view(request, *args, **kwargs)
@@ -0,0 +1,65 @@
+import hashlib
+import json
+
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+
+from apps.core.cache import get_version
+from apps.core.querystring import canonical_pairs
+
+PAGE_CACHE_TIMEOUT = 60 * 15
+
+
+def is_shared_cacheable(request):
+    """Общий кэш только для анонимных GET без отложенных сообщений"""
+    return (
+        request.method in ('GET', 'HEAD')
+        and not request.user.is_authenticated
+        and not len(get_messages(request))
+    )
+
+
+def page_cache_key(request, namespaces, defaults=None):
+    """Ключ: версии пространств, путь и канонические параметры запроса"""
+    params = canonical_pairs(request.GET, defaults)
+    versions = [get_version(namespace) for namespace in namespaces]
+    raw = json.dumps([versions, request.path, params], ensure_ascii=False)
+    return 'page:' + hashlib.md5(raw.encode()).hexdigest()
+
+
+class SharedPageCacheMixin:
+    """Кэш готовых страниц, общий для всех анонимных посетителей.
+
+    Персональные данные (корзина, избранное, сравнение) страница получает отдельным
+    запросом к user_state. Инвалидация - сменой версий из get_page_cache_namespaces().
+    """
+    page_cache_timeout = PAGE_CACHE_TIMEOUT
+
+    def get_page_cache_namespaces(self):
+        return ()
+
+    def dispatch(self, request, *args, **kwargs):
+        if not is_shared_cacheable(request):
+            return super().dispatch(request, *args, **kwargs)
+
+        key = page_cache_key(
+            request, self.get_page_cache_namespaces(), getattr(self, 'canonical_defaults', None)
+        )
+        response = cache.get(key)
+        if response is not None:
+            return response
+
+        response = super().dispatch(request, *args, **kwargs)
+        # Ответы с cookie (сессия, CSRF) персональны и в общий кэш не попадают
+        if response.status_code == 200 and not response.cookies and not response.streaming:
+            def store(rendered):
+                # CSRF-токен или изменение сессии при рендере тоже делают страницу персональной
+                if request.META.get('CSRF_COOKIE_NEEDS_UPDATE') or request.session.modified:
+                    return
+                cache.set(key, rendered, self.page_cache_timeout)
+
+            if hasattr(response, 'add_post_render_callback'):
+                response.add_post_render_callback(store)
+            else:
+                store(response)
+        return response
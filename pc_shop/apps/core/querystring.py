@@ -0,0 +1,47 @@
+from urllib.parse import parse_qsl
+
+from django.http import HttpResponseRedirect, QueryDict
+
+# Пустое значение этих параметров значимо (?cursor= - курсорный режим с первой страницы)
+KEEP_EMPTY_PARAMS = frozenset({'cursor'})
+
+
+def canonical_pairs(params, defaults=None):
+    """Параметры в каноническом виде: пробелы схлопнуты, пустые и значения по умолчанию
+    отброшены, ключи и значения отсортированы"""
+    defaults = defaults or {}
+    pairs = set()
+    for key in params:
+        for value in params.getlist(key):
+            value = ' '.join(value.split())
+            if value == '' and key not in KEEP_EMPTY_PARAMS:
+                continue
+            if defaults.get(key) == value:
+                continue
+            pairs.add((key, value))
+    return sorted(pairs)
+
+
+def canonical_query(params, defaults=None):
+    query = QueryDict(mutable=True)
+    for key, value in canonical_pairs(params, defaults):
+        query.appendlist(key, value)
+    return query.urlencode()
+
+
+class CanonicalQueryMixin:
+    """Редирект GET-запросов на каноническую строку запроса.
+
+    Перестановка параметров или пустые поля формы дают одну и ту же страницу - и один
+    ключ в кэше страниц.
+    """
+    canonical_defaults = {}
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method == 'GET':
+            pairs = canonical_pairs(request.GET, self.canonical_defaults)
+            raw = parse_qsl(request.META.get('QUERY_STRING', ''), keep_blank_values=True)
+            if raw != pairs:
+                query = canonical_query(request.GET, self.canonical_defaults)
+                return HttpResponseRedirect(f'{request.path}?{query}' if query else request.path)
+        return super().dispatch(request, *args, **kwargs)
@@ -1,7 +1,43 @@
 # core/views.py
+from django.http import JsonResponse
 from django.shortcuts import render
+from django.views.decorators.cache import never_cache
+from django.views.decorators.csrf import ensure_csrf_cookie
+from apps.accounts.models import WishlistItem
+from apps.cart.models import Cart
+from apps.compare.models import Comparison
 from apps.products.models import Product
 
 def home(request):
-    bestsellers = Product.objects.order_by('-created_at')[:4]
-    return render(request, 'home.html', {'bestsellers': bestsellers})
\ No newline at end of file
+    bestsellers = Product.objects.with_main_image().order_by('-created_at')[:4]
+    return render(request, 'home.html', {'bestsellers': bestsellers})
+
+
+@never_cache
+@ensure_csrf_cookie
+def user_state(request):
+    """Персональные данные для страниц из общего кэша: корзина, избранное, сравнение"""
+    session_key = request.session.session_key
+    if request.user.is_authenticated:
+        owner = {'user': request.user}
+    elif session_key:
+        owner = {'session_key': session_key}
+    else:
+        owner = None
+
+    cart = Cart.objects.filter(converted_order__isnull=True, **owner).first() if owner else None
+    wishlist = []
+    if request.user.is_authenticated:
+        wishlist = list(WishlistItem.objects.filter(
+            wishlist__user=request.user
+        ).values_list('product_id', flat=True))
+    compare = list(Comparison.objects.filter(**owner).values_list(
+        'products', flat=True
+    ).exclude(products=None)) if owner else []
+
+    return JsonResponse({
+        'authenticated': request.user.is_authenticated,
+        'cart_count': cart.items.count() if cart else 0,
+        'wishlist': wishlist,
+        'compare': compare,
+    })
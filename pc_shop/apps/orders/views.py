@@ -14,6 +14,7 @@ from apps.cart.utils import CartHandler
 from .models import Order, OrderItem
 from .forms import OrderCreateForm, OrderStatusUpdateForm  # Предполагается, что форма создана
 from apps.products.models import Product
+from apps.products.stock import fulfil_item
 from apps.cart.models import Cart
 
 
@@ -115,9 +116,8 @@ class OrderCreateView(FormView):
     def create_order_items(self, order, cart):
         items_to_create = []
         for item in cart.items.select_related('product'):
-            if item.product.quantity < item.quantity:
-                raise ValidationError(f'Недостаточно товара: {item.product.name}')
-
+            # Резерв позиции становится списанием со склада (apps.products.stock)
+            fulfil_item(item)
             items_to_create.append(OrderItem(
                 order=order,
                 product=item.product,
@@ -126,9 +126,6 @@ class OrderCreateView(FormView):
                 name_snapshot=item.product.name
             ))
 
-            item.product.quantity -= item.quantity
-            item.product.save(update_fields=['quantity'])
-
         OrderItem.objects.bulk_create(items_to_create)
 
     def clear_cart_and_associate(self, cart_handler, cart, order):
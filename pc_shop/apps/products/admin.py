@@ -1,12 +1,46 @@
-from django.contrib import admin
+import io
+
+from django import forms
+from django.contrib import admin, messages
 from django.contrib.admin import RelatedFieldListFilter
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.core.exceptions import PermissionDenied
 from django.utils.html import format_html
 from django.utils.translation import gettext_lazy as _
 from django.db.models import Prefetch
 from apps.products.models import Product, ProductImage, Review, ProductAttributeValue
+from apps.catalog_config.schema import get_category_schema
+from apps.products.importer import FEED_ENCODINGS, feed_format, import_feed, read_feed
+from apps.products.signals import refresh_attribute_products
 import time
 
 
+# Ошибок импорта в сообщениях админки, остальные - в import_catalog
+IMPORT_ERRORS_SHOWN = 20
+# Импорт из админки идет в запросе; большие фиды - командой import_catalog
+IMPORT_MAX_UPLOAD_SIZE = 5 * 1024 * 1024
+
+
+class ProductImportForm(forms.Form):
+    feed = forms.FileField(label=_("Файл CSV или JSONL"))
+    encoding = forms.ChoiceField(label=_("Кодировка"), choices=list(FEED_ENCODINGS.items()))
+    dry_run = forms.BooleanField(label=_("Только проверить"), required=False)
+
+    def clean_feed(self):
+        feed = self.cleaned_data['feed']
+        if feed.size > IMPORT_MAX_UPLOAD_SIZE:
+            raise forms.ValidationError(_(
+                "Файл больше %(size)d МБ: импортируйте его командой manage.py import_catalog"
+            ) % {'size': IMPORT_MAX_UPLOAD_SIZE // (1024 * 1024)})
+        try:
+            feed.format = feed_format(feed.name)
+        except ValueError as e:
+            raise forms.ValidationError(str(e))
+        return feed
+
+
 class ProductImageInline(admin.TabularInline):
     model = ProductImage
     extra = 0
@@ -65,9 +99,10 @@ class ProductAdmin(admin.ModelAdmin):
             )
         }),
         (_("Инвентаризация"), {
-            'fields': ('quantity', 'is_available'),
+            'fields': ('quantity', 'reserved_quantity', 'is_available'),
         }),
     )
+    readonly_fields = ('reserved_quantity',)
 
     def get_queryset(self, request):
         return super().get_queryset(request).prefetch_related(
@@ -81,32 +116,87 @@ class ProductAdmin(admin.ModelAdmin):
     category_hierarchy.short_description = _("Путь категории")
 
     def stock_status(self, obj):
-        if obj.quantity <= 0:
+        # Доступный остаток: на складе за вычетом резерва корзин
+        available = obj.available_quantity
+        if available <= 0:
             return format_html('<span style="color: red;">{}</span>', _("Нет в наличии"))
-        if obj.quantity < 10:
-            return format_html(f'<span style="color: orange;">{obj.quantity} {_("шт.")}</span>')
-        return format_html(f'<span style="color: green;">{obj.quantity} {_("шт.")}</span>')
+        if available < 10:
+            return format_html(f'<span style="color: orange;">{available} {_("шт.")}</span>')
+        return format_html(f'<span style="color: green;">{available} {_("шт.")}</span>')
 
     stock_status.short_description = _("Остаток")
 
     def main_image_preview(self, obj):
-        return obj.main_image.preview_thumbnail() if obj.main_image else '-'
+        main_image = obj.main_image()
+        return main_image.preview_thumbnail() if main_image else '-'
 
     main_image_preview.short_description = _("Главное изображение")
 
     def update_attributes(self, request, queryset):
-        for product in queryset:
-            attributes = product.category.get_all_attributes()
-            for attr in attributes:
-                ProductAttributeValue.objects.get_or_create(
-                    product=product,
-                    attribute=attr,
-                    defaults={'value': attr.default_value()}
-                )
+        # Заглушки не создаются: пустое значение не проходит ProductAttributeValue.clean,
+        # а "Нет" выдавалось бы за характеристику; пересчитываются производные данные
+        products = list(queryset.only('id', 'category_id'))
+        existing = set(ProductAttributeValue.objects.filter(
+            product__in=products
+        ).values_list('product_id', 'attribute_id'))
+        refresh_attribute_products([product.id for product in products])
+
+        incomplete = sum(
+            1 for product in products
+            if any(
+                attr['is_required'] and (product.id, attr['id']) not in existing
+                for attr in get_category_schema(product.category_id).attributes
+            )
+        )
         self.message_user(request, _("Атрибуты успешно обновлены"))
+        if incomplete:
+            self.message_user(
+                request, _("Не заполнены обязательные атрибуты у товаров: %d") % incomplete, messages.WARNING
+            )
 
     update_attributes.short_description = _("Обновить атрибуты для выбранных товаров")
 
+    def get_urls(self):
+        custom_urls = [
+            path(
+                'import/',
+                self.admin_site.admin_view(self.import_feed_view),
+                name='products_product_import'
+            ),
+        ]
+        return custom_urls + super().get_urls()
+
+    def import_feed_view(self, request):
+        """Загрузка фида через apps.products.importer"""
+        if not self.has_add_permission(request) or not self.has_change_permission(request):
+            raise PermissionDenied
+        form = ProductImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            feed = form.cleaned_data['feed']
+            dry_run = form.cleaned_data['dry_run']
+            stream = io.TextIOWrapper(feed.file, encoding=form.cleaned_data['encoding'], newline='')
+            report = import_feed(read_feed(stream, feed.format), dry_run=dry_run)
+
+            for line, sku, message in report.errors[:IMPORT_ERRORS_SHOWN]:
+                self.message_user(request, f"Строка {line} ({sku or '-'}): {message}", messages.WARNING)
+            if len(report.errors) > IMPORT_ERRORS_SHOWN:
+                self.message_user(
+                    request, f"Еще ошибок: {len(report.errors) - IMPORT_ERRORS_SHOWN}", messages.WARNING
+                )
+            self.message_user(request, (
+                f"{'Проверено' if dry_run else 'Импортировано'}: строк {report.rows}, "
+                f"новых {report.created}, обновленных {report.updated}, ошибок {len(report.errors)}"
+            ), messages.SUCCESS if not report.errors else messages.WARNING)
+            return redirect('admin:products_product_changelist')
+
+        return TemplateResponse(request, 'admin/products/product/import_feed.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': _("Импорт фида"),
+            'form': form,
+            'max_upload_size': IMPORT_MAX_UPLOAD_SIZE,
+        })
+
     def save_model(self, request, obj, form, change):
         if not obj.sku:
             obj.sku = f"PRD-{obj.category.id}-{int(time.time())}"
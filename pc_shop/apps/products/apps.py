@@ -3,4 +3,10 @@ from django.apps import AppConfig
 
 class ProductsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'apps.products'
\ No newline at end of file
+    name = 'apps.products'
+
+    def ready(self):
+        from django.db.models.signals import pre_migrate
+        import apps.products.signals
+
+        pre_migrate.connect(apps.products.signals.create_trigram_extension, sender=self)
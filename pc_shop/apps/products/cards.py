@@ -0,0 +1,48 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from apps.core.cache import bump_version, get_versions
+
+CARD_NAMESPACE = 'product_card'
+CARD_TEMPLATE = 'products/includes/product_card.html'
+CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def card_namespace(product_id):
+    """Версия карточки товара: цена, остатки, изображения, рейтинг"""
+    return f'{CARD_NAMESPACE}:{product_id}'
+
+
+def invalidate_product_cards(product_ids):
+    product_ids = set(product_ids)
+
+    def bump():
+        for product_id in product_ids:
+            bump_version(card_namespace(product_id))
+
+    transaction.on_commit(bump)
+
+
+def render_product_cards(products):
+    """HTML карточек страницы: версии и готовые карточки - двумя get_many,
+    рендер только для отсутствующих в кэше"""
+    products = list(products)
+    versions = get_versions(card_namespace(product.pk) for product in products)
+    keys = {
+        product.pk: f'{card_namespace(product.pk)}:v{versions[card_namespace(product.pk)]}'
+        for product in products
+    }
+    cached = cache.get_many(keys.values())
+
+    cards, missing = [], {}
+    for product in products:
+        key = keys[product.pk]
+        html = cached.get(key)
+        if html is None:
+            html = missing[key] = render_to_string(CARD_TEMPLATE, {'product': product})
+        cards.append(mark_safe(html))
+    if missing:
+        cache.set_many(missing, CARD_CACHE_TIMEOUT)
+    return cards
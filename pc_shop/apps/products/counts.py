@@ -0,0 +1,95 @@
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.db import connections
+
+from apps.core.cache import get_version
+from apps.products.invalidation import CATALOG_NAMESPACE
+
+COUNT_CACHE_TIMEOUT = 60 * 5
+# Начиная с этого порога вместо COUNT(*) используется оценка планировщика
+ESTIMATE_THRESHOLD = 1000
+# Параметры, не влияющие на количество результатов
+COUNT_IGNORED_PARAMS = {'page', 'cursor', 'sort'}
+
+
+class ResultCount:
+    """Количество результатов: точное или оценка планировщика (выводится как "1000+")"""
+
+    def __init__(self, value, is_estimate=False):
+        self.value = value
+        self.is_estimate = is_estimate
+
+    def __int__(self):
+        return self.value
+
+    def __str__(self):
+        if not self.is_estimate:
+            return str(self.value)
+        # Округляем оценку вниз до одной значащей цифры: 53214 -> "50000+"
+        magnitude = 10 ** (len(str(self.value)) - 1)
+        return f"{self.value // magnitude * magnitude}+"
+
+
+def normalize_filter_key(path, params):
+    """Ключ состояния фильтров: порядок и пустые значения параметров не важны"""
+    items = sorted(
+        (key, sorted(value for value in params.getlist(key) if value != ''))
+        for key in params
+        if key not in COUNT_IGNORED_PARAMS
+    )
+    items = [(key, values) for key, values in items if values]
+    raw = json.dumps([path, items], ensure_ascii=False)
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def estimate_count(queryset):
+    """Оценка числа строк по EXPLAIN без выполнения запроса"""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def _count_cache_key(prefix, key):
+    # Версия каталога: количество пересчитывается после изменения товаров
+    return f'{prefix}:v{get_version(CATALOG_NAMESPACE)}:{key}' if key else None
+
+
+def get_exact_count(queryset, key=None):
+    """Точное COUNT(*) с кэшированием по ключу фильтров - для номеров страниц"""
+    cache_key = _count_cache_key('exact_count', key)
+    if cache_key:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+    count = queryset.count()
+    if cache_key:
+        cache.set(cache_key, count, COUNT_CACHE_TIMEOUT)
+    return count
+
+
+def get_result_count(queryset, key=None):
+    """Количество результатов с кэшированием по ключу фильтров"""
+    cache_key = _count_cache_key('result_count', key)
+    if cache_key:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return ResultCount(*cached)
+
+    estimate = estimate_count(queryset)
+    if estimate is not None and estimate >= ESTIMATE_THRESHOLD:
+        result = ResultCount(estimate, is_estimate=True)
+    else:
+        result = ResultCount(queryset.count())
+
+    if cache_key:
+        cache.set(cache_key, (result.value, result.is_estimate), COUNT_CACHE_TIMEOUT)
+    return result
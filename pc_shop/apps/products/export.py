@@ -0,0 +1,171 @@
+import csv
+import json
+from itertools import groupby
+from xml.sax.saxutils import escape, quoteattr
+
+from django.core.files.storage import default_storage
+from django.db.models import OuterRef, Subquery
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.catalog_config.models import Attribute
+from apps.catalog_config.schema import get_branch_groups
+from apps.catalog_config.tree import get_category_tree
+from apps.products.importer import ATTRIBUTE_COLUMN_PREFIX
+from apps.products.models import Product, ProductImage
+from apps.products.specs import BOOLEAN_LABELS
+
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+    'yml': 'application/xml; charset=utf-8',
+}
+EXPORT_EXTENSIONS = {'csv': 'csv', 'jsonl': 'jsonl', 'yml': 'xml'}
+# Поля CSV и JSONL совпадают с форматом apps.products.importer
+EXPORT_FIELDS = ('sku', 'name', 'category', 'price', 'quantity', 'is_digital', 'slug', 'description')
+PRODUCT_VALUES = (
+    'id', 'sku', 'name', 'slug', 'category_id', 'price', 'quantity', 'is_available', 'is_digital', 'description'
+)
+ATTRIBUTE_VALUES = (
+    'attributes__attribute_id', 'attributes__attribute__name', 'attributes__attribute__unit',
+    'attributes__attribute__data_type', 'attributes__value'
+)
+YML_SHOP_NAME = 'PC Shop'
+
+
+def iter_products(category_id=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Товары с атрибутами одним проходом: LEFT JOIN значений, упорядоченный по товару,
+    читается серверным курсором и группируется по товару"""
+    tree = get_category_tree()
+    products = Product.objects.all()
+    if category_id is not None:
+        products = products.filter(category_id__in=tree.descendant_ids(category_id))
+
+    rows = products.annotate(
+        image=Subquery(
+            ProductImage.objects.filter(product=OuterRef('pk')).order_by('-is_main', 'id').values('image')[:1]
+        )
+    ).order_by('id', 'attributes__attribute_id').values(*PRODUCT_VALUES, 'image', *ATTRIBUTE_VALUES)
+
+    for _, group in groupby(rows.iterator(chunk_size=chunk_size), key=lambda row: row['id']):
+        group = list(group)
+        product = {field: group[0][field] for field in PRODUCT_VALUES}
+        node = tree.get(product['category_id'])
+        product['category'] = node['slug'] if node else product['category_id']
+        product['image'] = group[0]['image']
+        product['attributes'] = [
+            {
+                'id': row['attributes__attribute_id'],
+                'name': row['attributes__attribute__name'],
+                'unit': row['attributes__attribute__unit'],
+                'data_type': row['attributes__attribute__data_type'],
+                'value': row['attributes__value'],
+            }
+            for row in group if row['attributes__attribute_id'] is not None
+        ]
+        yield product
+
+
+def export_attribute_names(category_id=None):
+    """Столбцы атрибутов CSV: атрибуты категории и ее предков или все атрибуты"""
+    if category_id is not None:
+        names = [attribute['name'] for group in get_branch_groups(category_id) for attribute in group['attributes']]
+    else:
+        names = Attribute.objects.order_by('tree_id', 'lft').values_list('name', flat=True)
+    return list(dict.fromkeys(names))
+
+
+class Echo:
+    """Буфер для csv.writer: строка возвращается сразу в поток ответа"""
+
+    def write(self, value):
+        return value
+
+
+def _csv_value(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, list):
+        return ', '.join(map(str, value))
+    return '' if value is None else value
+
+
+def export_csv(products, attribute_names):
+    writer = csv.writer(Echo())
+    yield writer.writerow([*EXPORT_FIELDS, *(ATTRIBUTE_COLUMN_PREFIX + name for name in attribute_names)])
+    for product in products:
+        values = {attribute['name']: attribute['value'] for attribute in product['attributes']}
+        yield writer.writerow([
+            *(_csv_value(product[field]) for field in EXPORT_FIELDS),
+            *(_csv_value(values.get(name)) for name in attribute_names),
+        ])
+
+
+def export_jsonl(products):
+    for product in products:
+        row = {field: product[field] for field in EXPORT_FIELDS}
+        row['price'] = str(row['price'])
+        row['attributes'] = {attribute['name']: attribute['value'] for attribute in product['attributes']}
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+def _yml_param(attribute):
+    value = attribute['value']
+    if attribute['data_type'] == 'boolean':
+        value = BOOLEAN_LABELS.get(value, value)
+    elif isinstance(value, list):
+        value = ', '.join(map(str, value))
+    unit = f' unit={quoteattr(attribute["unit"])}' if attribute['unit'] else ''
+    return f'<param name={quoteattr(attribute["name"])}{unit}>{escape(str(value))}</param>'
+
+
+def export_yml(products, base_url, category_id=None):
+    """Фид YML (Яндекс.Маркет): категории, затем предложения по одному"""
+    tree = get_category_tree()
+    category_ids = tree.descendant_ids(category_id) if category_id is not None else list(tree.nodes)
+
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield f'<yml_catalog date="{timezone.localtime().strftime("%Y-%m-%dT%H:%M%z")}">\n<shop>\n'
+    yield f'<name>{escape(YML_SHOP_NAME)}</name>\n<url>{escape(base_url)}</url>\n'
+    yield '<currencies><currency id="RUR" rate="1"/></currencies>\n<categories>\n'
+    for pk in sorted(category_ids):
+        node = tree.get(pk)
+        parent = f' parentId="{node["parent_id"]}"' if node['parent_id'] and pk != category_id else ''
+        yield f'<category id="{pk}"{parent}>{escape(node["name"])}</category>\n'
+    yield '</categories>\n<offers>\n'
+
+    for product in products:
+        url = base_url + reverse('product_detail', kwargs={'product_slug': product['slug']})
+        parts = [
+            f'<offer id={quoteattr(product["sku"])} available="{"true" if product["is_available"] else "false"}">',
+            f'<url>{escape(url)}</url>',
+            f'<price>{product["price"]}</price>',
+            '<currencyId>RUR</currencyId>',
+            f'<categoryId>{product["category_id"]}</categoryId>',
+        ]
+        if product['image']:
+            picture = default_storage.url(product['image'])
+            if picture.startswith('/'):
+                picture = base_url + picture
+            parts.append(f'<picture>{escape(picture)}</picture>')
+        parts += [
+            f'<name>{escape(product["name"])}</name>',
+            f'<description>{escape(product["description"])}</description>',
+            *(_yml_param(attribute) for attribute in product['attributes']),
+            '</offer>\n',
+        ]
+        yield ''.join(parts)
+    yield '</offers>\n</shop>\n</yml_catalog>\n'
+
+
+def export_feed(format, category_id=None, base_url='', chunk_size=EXPORT_CHUNK_SIZE):
+    """Генератор фрагментов фида: память не зависит от размера каталога"""
+    products = iter_products(category_id, chunk_size)
+    if format == 'csv':
+        return export_csv(products, export_attribute_names(category_id))
+    if format == 'jsonl':
+        return export_jsonl(products)
+    if format == 'yml':
+        return export_yml(products, base_url.rstrip('/'), category_id)
+    raise ValueError(f"Неизвестный формат фида: {format}")
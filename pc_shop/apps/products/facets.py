@@ -0,0 +1,165 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from apps.catalog_config.schema import SCHEMA_NAMESPACE, get_category_schema
+from apps.core.cache import get_version
+from apps.products.counts import COUNT_CACHE_TIMEOUT, normalize_filter_key
+from apps.products.invalidation import CATALOG_NAMESPACE
+from apps.products.models import ProductAttributeValue
+
+FACET_CACHE_TIMEOUT = COUNT_CACHE_TIMEOUT
+FACET_DATA_TYPES = ('enum', 'boolean')
+# Границы ценовых диапазонов; последний диапазон открыт сверху
+PRICE_BUCKETS = (0, 1000, 5000, 10000, 30000, 60000, 100000)
+PRICE_RANGES = tuple(zip(PRICE_BUCKETS, PRICE_BUCKETS[1:] + (None,)))
+PRICE_PARAMS = ('price_min', 'price_max')
+BOOLEAN_CHOICES = (('true', 'Да', True), ('false', 'Нет', False))
+
+
+def _without(data, params):
+    data = data.copy()
+    for param in params:
+        data.pop(param, None)
+    return data
+
+
+def _filtered_queryset(filterset_class, data, queryset, exclude_params=()):
+    """Результат фильтрации без собственного выбора фасета"""
+    return filterset_class(_without(data, exclude_params), queryset=queryset).qs.order_by()
+
+
+def _value_counts(products, attribute_ids):
+    """Количество товаров по значениям атрибутов - один сгруппированный запрос"""
+    counts = defaultdict(dict)
+    rows = ProductAttributeValue.objects.filter(
+        product__in=products.values('pk'),
+        attribute_id__in=attribute_ids
+    ).values('attribute_id', 'value_option_id', 'value_boolean').annotate(n=Count('id')).order_by()
+    for row in rows:
+        key = row['value_option_id'] if row['value_option_id'] is not None else row['value_boolean']
+        counts[row['attribute_id']][key] = row['n']
+    return counts
+
+
+def _price_bucket_counts(products_qs):
+    aggregates = {}
+    for index, (low, high) in enumerate(PRICE_RANGES):
+        condition = Q(price__gte=low)
+        if high is not None:
+            condition &= Q(price__lt=high)
+        aggregates[f'bucket_{index}'] = Count('pk', filter=condition)
+    counts = products_qs.aggregate(**aggregates)
+    return [counts[f'bucket_{index}'] for index in range(len(PRICE_RANGES))]
+
+
+def facet_attributes(schema):
+    return [attr for attr in schema.attributes if attr['data_type'] in FACET_DATA_TYPES]
+
+
+def selected_facet_values(attributes, data):
+    """{attribute_id: выбранные значения} для фасетов с выбором"""
+    selected = {}
+    for attr in attributes:
+        values = [value for value in data.getlist(f'attr_{attr["id"]}') if value != '']
+        if values:
+            selected[attr['id']] = values
+    return selected
+
+
+def build_facets(schema, data, counts, price_counts, bounds):
+    """Структура фасетов для шаблона из посчитанных значений.
+
+    counts - {attribute_id: {option_id или bool: количество}}, price_counts - по PRICE_RANGES,
+    bounds - {attribute_id: (мин, макс)} числовых атрибутов.
+    """
+    attributes = facet_attributes(schema)
+    selected = selected_facet_values(attributes, data)
+
+    facets = []
+    for attr in attributes:
+        attr_counts = counts.get(attr['id'], {})
+        chosen = selected.get(attr['id'], [])
+        if attr['data_type'] == 'enum':
+            options = [
+                {'value': str(option_id), 'label': label, 'count': attr_counts.get(option_id, 0),
+                 'selected': str(option_id) in chosen}
+                for option_id, label in attr['options']
+            ]
+        else:
+            options = [
+                {'value': value, 'label': label, 'count': attr_counts.get(flag, 0),
+                 'selected': value in chosen}
+                for value, label, flag in BOOLEAN_CHOICES
+            ]
+        facets.append({
+            'param': f'attr_{attr["id"]}',
+            'name': attr['name'],
+            'unit': attr['unit'],
+            'data_type': attr['data_type'],
+            'group_ids': attr['group_ids'],
+            'options': options,
+        })
+
+    ranges = [
+        {
+            'param': f'attr_{attr["id"]}',
+            'name': attr['name'],
+            'unit': attr['unit'],
+            'bounds': bounds.get(attr['id']),
+            'value_min': data.get(f'attr_{attr["id"]}_min', ''),
+            'value_max': data.get(f'attr_{attr["id"]}_max', ''),
+        }
+        for attr in schema.attributes if attr['data_type'] == 'number'
+    ]
+
+    selected_min, selected_max = data.get('price_min', ''), data.get('price_max', '')
+    price = []
+    for (low, high), count in zip(PRICE_RANGES, price_counts):
+        # Фильтр цены включает обе границы: верхняя граница диапазона - на копейку меньше
+        price_max = str(Decimal(high) - Decimal('0.01')) if high is not None else ''
+        price.append({
+            'label': f'{low} – {high} ₽' if high is not None else f'от {low} ₽',
+            'price_min': str(low),
+            'price_max': price_max,
+            'count': count,
+            'selected': selected_min == str(low) and selected_max == price_max,
+        })
+
+    return {'attributes': facets, 'ranges': ranges, 'price': price}
+
+
+def compute_facets(filterset_class, data, queryset, category_id):
+    """Фасеты категории со счетчиками при текущем состоянии фильтров.
+
+    Счетчик фасета учитывает все фильтры, кроме выбора в самом фасете. Фасеты без выбора
+    считаются одним запросом, каждый фасет с выбором и цена - еще по одному.
+    """
+    schema = get_category_schema(category_id)
+    attributes = facet_attributes(schema)
+    selected = selected_facet_values(attributes, data)
+
+    full = _filtered_queryset(filterset_class, data, queryset)
+    counts = _value_counts(full, [attr['id'] for attr in attributes if attr['id'] not in selected])
+    for attribute_id in selected:
+        own = _filtered_queryset(filterset_class, data, queryset, [f'attr_{attribute_id}'])
+        counts.update(_value_counts(own, [attribute_id]))
+
+    price_counts = _price_bucket_counts(
+        _filtered_queryset(filterset_class, data, queryset, PRICE_PARAMS)
+    )
+    return build_facets(schema, data, counts, price_counts, filterset_class.numeric_bounds)
+
+
+def get_facets(filterset_class, data, queryset, category_id, path):
+    """Фасеты с кэшем по нормализованному состоянию фильтров и версиям схемы и каталога"""
+    key = 'facets:v{}.{}:{}'.format(
+        get_version(SCHEMA_NAMESPACE), get_version(CATALOG_NAMESPACE), normalize_filter_key(path, data)
+    )
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(filterset_class, data, queryset, category_id)
+        cache.set(key, facets, FACET_CACHE_TIMEOUT)
+    return facets
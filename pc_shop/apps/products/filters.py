@@ -1,8 +1,34 @@
+import time
+
 import django_filters
-from django.db.models import Q
+from django.db.models import Max, Min, Q
+from django_filters.widgets import RangeWidget
 from django.utils.translation import gettext_lazy as _
-from apps.products.models import Product
-from apps.catalog_config.models import Attribute, Category
+from apps.products.models import Product, ProductAttributeValue
+from apps.products.search import search_products
+from apps.catalog_config.models import Category
+from apps.catalog_config.schema import SCHEMA_NAMESPACE, get_category_schema
+from apps.catalog_config.tree import get_category_tree
+from apps.core.cache import get_version
+
+# Границы числовых фильтров зависят от данных, а не от схемы: пересчитываются по таймауту
+FILTER_BOUNDS_TIMEOUT = 60 * 15
+
+# Готовые классы фильтров по категориям: {category_id: (версия схемы, срок, класс)}
+_category_filtersets = {}
+
+
+def get_numeric_bounds(category_id, schema):
+    """Мин./макс. числовых атрибутов по товарам категории с подкатегориями - один запрос"""
+    attribute_ids = [attr['id'] for attr in schema.attributes if attr['data_type'] == 'number']
+    if not attribute_ids:
+        return {}
+    rows = ProductAttributeValue.objects.filter(
+        attribute_id__in=attribute_ids,
+        product__category_id__in=get_category_tree().descendant_ids(category_id),
+        value_number__isnull=False
+    ).values('attribute_id').annotate(low=Min('value_number'), high=Max('value_number')).order_by()
+    return {row['attribute_id']: (row['low'], row['high']) for row in rows}
 
 
 class ProductFilter(django_filters.FilterSet):
@@ -38,85 +64,106 @@ class ProductFilter(django_filters.FilterSet):
         model = Product
         fields = ['sku', 'price', 'category', 'is_digital']
 
-    def __init__(self, *args, **kwargs):
-        # Удаляем получение категории из kwargs
-        super().__init__(*args, **kwargs)
-        self.add_dynamic_attribute_filters()
-
-    def add_dynamic_attribute_filters(self):
-        category_slug = self.data.get('category_slug')  # Получаем из GET-параметров
-        if category_slug:
-            try:
-                category = Category.objects.get(slug=category_slug)
-                attributes = category.get_all_attributes()
-
-                for attr in attributes:
-                    self.filters[f'attr_{attr.id}'] = self.create_attribute_filter(attr)
-
-            except Category.DoesNotExist:
-                pass
-
-    def create_attribute_filter(self, attribute):
-        """Создает фильтр для конкретного атрибута"""
-        if attribute.data_type == 'enum':
-            return django_filters.ModelMultipleChoiceFilter(
-                field_name=f'attributes__attribute__id',
-                queryset=attribute.enum_options.all(),
-                label=attribute.name,
-                method=f'filter_by_enum_attribute'
+    # Границы числовых атрибутов {attribute_id: (мин, макс)}, задаются в for_category
+    numeric_bounds = {}
+
+    @classmethod
+    def for_category(cls, category_id):
+        """Класс фильтров категории с атрибутными фильтрами; строится один раз на версию схемы"""
+        version = get_version(SCHEMA_NAMESPACE)
+        cached = _category_filtersets.get(category_id)
+        if cached and cached[0] == version and cached[1] > time.monotonic():
+            return cached[2]
+
+        schema = get_category_schema(category_id)
+        bounds = get_numeric_bounds(category_id, schema)
+        declared = {
+            f'attr_{attr["id"]}': cls.create_attribute_filter(attr, bounds.get(attr['id']))
+            for attr in schema.attributes
+        }
+        declared['numeric_bounds'] = bounds
+        filterset = type(f'{cls.__name__}ForCategory{category_id}', (cls,), declared)
+        _category_filtersets[category_id] = (version, time.monotonic() + FILTER_BOUNDS_TIMEOUT, filterset)
+        return filterset
+
+    @staticmethod
+    def create_attribute_filter(attribute, bounds=None):
+        """Создает фильтр для атрибута из схемы категории"""
+        field_name = f'attr_{attribute["id"]}'
+        if attribute['data_type'] == 'enum':
+            # Варианты из схемы: проверка выбора без запроса к EnumOption
+            return django_filters.MultipleChoiceFilter(
+                field_name=field_name,
+                choices=[(str(option_id), value) for option_id, value in attribute['options']],
+                label=attribute['name'],
+                method='filter_by_enum_attribute'
             )
 
-        elif attribute.data_type == 'number':
+        elif attribute['data_type'] == 'number':
+            attrs = {'step': 'any'}
+            if bounds:
+                attrs.update(min=bounds[0], max=bounds[1])
             return django_filters.NumericRangeFilter(
-                field_name=f'attributes__value',
-                label=attribute.name,
-                method=f'filter_by_numeric_attribute'
+                field_name=field_name,
+                label=attribute['name'],
+                method='filter_by_numeric_attribute',
+                widget=RangeWidget(attrs=attrs)
+            )
+
+        elif attribute['data_type'] == 'boolean':
+            return django_filters.BooleanFilter(
+                field_name=field_name,
+                label=attribute['name'],
+                method='filter_by_boolean_attribute'
             )
 
-        else:  # string/boolean
+        else:  # string
             return django_filters.CharFilter(
-                field_name=f'attributes__value',
-                lookup_expr='icontains',
-                label=attribute.name,
-                method=f'filter_by_generic_attribute'
+                field_name=field_name,
+                label=attribute['name'],
+                method='filter_by_generic_attribute'
             )
 
     def filter_by_category_tree(self, queryset, name, value):
         """Фильтрация по категории и ее подкатегориям"""
         return queryset.filter(
-            category__in=value.get_descendants(include_self=True)
+            category_id__in=get_category_tree().descendant_ids(value.id)
         )
 
     def custom_search(self, queryset, name, value):
-        """Расширенный поиск с учетом SKU"""
-        return queryset.filter(
-            Q(name__icontains=value) |
-            Q(sku__iexact=value) |
-            Q(description__icontains=value)
-        ).distinct()
+        """Полнотекстовый поиск с учетом SKU"""
+        return search_products(queryset, value)
 
-    # Методы фильтрации атрибутов
+    # Методы фильтрации атрибутов (по типизированным колонкам ProductAttributeValue)
     def filter_by_enum_attribute(self, queryset, name, value):
-        attr_id = name.split('__')[0].replace('attr_', '')
+        if not value:
+            return queryset
+        attr_id = name.replace('attr_', '')
         return queryset.filter(
-            attributes__attribute__id=attr_id,
-            attributes__value__in=value.values_list('value', flat=True)
+            attributes__attribute_id=attr_id,
+            attributes__value_option__in=value
         )
 
     def filter_by_numeric_attribute(self, queryset, name, value):
-        attr_id = name.split('__')[0].replace('attr_', '')
-        qs = queryset.filter(attributes__attribute__id=attr_id)
+        attr_id = name.replace('attr_', '')
+        lookups = {'attributes__attribute_id': attr_id}
 
-        if value.start and value.stop:
-            return qs.filter(
-                attributes__value__gte=value.start,
-                attributes__value__lte=value.stop
-            )
-        return qs
+        if value.start is not None:
+            lookups['attributes__value_number__gte'] = value.start
+        if value.stop is not None:
+            lookups['attributes__value_number__lte'] = value.stop
+        return queryset.filter(**lookups)
+
+    def filter_by_boolean_attribute(self, queryset, name, value):
+        attr_id = name.replace('attr_', '')
+        return queryset.filter(
+            attributes__attribute_id=attr_id,
+            attributes__value_boolean=value
+        )
 
     def filter_by_generic_attribute(self, queryset, name, value):
-        attr_id = name.split('__')[0].replace('attr_', '')
+        attr_id = name.replace('attr_', '')
         return queryset.filter(
-            attributes__attribute__id=attr_id,
-            attributes__value__icontains=value
+            attributes__attribute_id=attr_id,
+            attributes__value_string=value
         )
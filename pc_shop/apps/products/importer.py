@@ -0,0 +1,396 @@
+import csv
+import json
+import re
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_slug
+from django.db import DatabaseError, transaction
+from django.db.models import BooleanField, ExpressionWrapper, F, Q
+from django.utils.text import slugify
+
+from apps.catalog_config.schema import get_branch_groups
+from apps.catalog_config.tree import get_category_tree, invalidate_category_tree
+from apps.products.cards import invalidate_product_cards
+from apps.products.invalidation import invalidate_catalog
+from apps.products.models import Product, ProductAttributeValue
+from apps.products.search import update_search_vector
+from apps.products.specs import refresh_spec_sheets
+
+IMPORT_CHUNK_SIZE = 1000
+IMPORT_FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}
+# Кодировки фидов: выгрузки поставщиков нередко в Windows-1251
+FEED_ENCODINGS = {'utf-8-sig': 'UTF-8', 'cp1251': 'Windows-1251'}
+# Столбцы CSV со значениями атрибутов: "attr:Объём"; в JSONL - словарь "attributes"
+ATTRIBUTE_COLUMN_PREFIX = 'attr:'
+REQUIRED_FIELDS = ('sku', 'name', 'category', 'price')
+# Необязательные поля обновляются у существующих товаров, только если есть в строке
+OPTIONAL_FIELDS = ('slug', 'description', 'quantity', 'is_digital')
+TRUE_VALUES = {'true', '1', 'yes', 'да'}
+FALSE_VALUES = {'false', '0', 'no', 'нет'}
+SKU_MAX_LENGTH = Product._meta.get_field('sku').max_length
+SLUG_MAX_LENGTH = Product._meta.get_field('slug').max_length
+# Транслитерация для адресов из артикулов: slugify отбрасывает кириллицу ("ЖД-001" -> "001")
+TRANSLIT = str.maketrans({
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'zh', 'з': 'z',
+    'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r',
+    'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh',
+    'щ': 'shch', 'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+})
+
+
+class ImportReport:
+    """Итоги импорта: счетчики и ошибки строк (номер строки, артикул, сообщение)"""
+
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.errors = []
+
+    @property
+    def imported(self):
+        return self.created + self.updated
+
+    def add_error(self, line, sku, message):
+        self.errors.append((line, sku or '', message))
+
+
+def feed_format(filename):
+    for suffix, name in IMPORT_FORMATS.items():
+        if filename.lower().endswith(suffix):
+            return name
+    raise ValueError(f"Неизвестный формат файла: {filename}")
+
+
+def read_csv(stream):
+    for line, row in enumerate(csv.DictReader(stream), start=2):
+        attributes = {}
+        fields = {'attributes': attributes}
+        for key, value in row.items():
+            if not key:
+                continue
+            if key.startswith(ATTRIBUTE_COLUMN_PREFIX):
+                attributes[key[len(ATTRIBUTE_COLUMN_PREFIX):].strip()] = value
+            elif value != '':
+                fields[key.strip()] = value
+        yield line, fields
+
+
+def read_jsonl(stream):
+    for line, text in enumerate(stream, start=1):
+        if not text.strip():
+            continue
+        try:
+            row = json.loads(text)
+        except ValueError as e:
+            yield line, ValidationError(f"Некорректный JSON: {e}")
+            continue
+        if not isinstance(row, dict):
+            yield line, ValidationError("Строка должна быть JSON-объектом")
+            continue
+        yield line, row
+
+
+def read_feed(stream, format):
+    """Поток строк фида: пары (номер строки, словарь полей или ValidationError).
+
+    Ошибка декодирования останавливает чтение: дальше строк не разобрать,
+    она попадает в отчет ошибкой строки, на которой прервалось чтение.
+    """
+    line = 0
+    try:
+        for line, row in read_csv(stream) if format == 'csv' else read_jsonl(stream):
+            yield line, row
+    except UnicodeDecodeError as e:
+        yield line + 1, ValidationError(
+            f"Файл не читается в кодировке {e.encoding}: укажите кодировку фида, чтение остановлено"
+        )
+
+
+def _parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    raise ValueError(value)
+
+
+def _parse_number(value):
+    if isinstance(value, bool):
+        raise ValueError(value)
+    if isinstance(value, (int, float)):
+        return value
+    text = str(value).strip().replace(',', '.')
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+def clean_attribute_value(attribute, value):
+    """Проверка значения по схеме атрибута без запросов к базе (как ProductAttributeValue.clean)"""
+    data_type = attribute['data_type']
+    try:
+        if data_type == 'number':
+            return _parse_number(value)
+        if data_type == 'boolean':
+            return _parse_bool(value)
+    except (TypeError, ValueError):
+        raise ValidationError(
+            f"«{attribute['name']}»: требуется {'числовое' if data_type == 'number' else 'логическое'} значение"
+        )
+
+    value = str(value).strip()
+    if data_type == 'enum' and value not in {option for _, option in attribute['options']}:
+        raise ValidationError(f"«{attribute['name']}»: недопустимое значение «{value}»")
+    if data_type == 'string' and attribute['validation_regex'] and not re.match(attribute['validation_regex'], value):
+        raise ValidationError(f"«{attribute['name']}»: неверный формат строки")
+    return value
+
+
+def _category_attributes(category_id):
+    """{имя или id атрибута: атрибут} для групп категории и ее предков"""
+    attributes = {}
+    for group in get_branch_groups(category_id):
+        for attribute in group['attributes']:
+            attributes[str(attribute['id'])] = attribute
+            attributes[attribute['name'].casefold()] = attribute
+    return attributes
+
+
+def clean_row(row, tree=None, schemas=None):
+    """Поля товара и значения атрибутов {attribute_id: значение} из строки фида.
+
+    tree и schemas ({category_id: атрибуты}) переиспользуются между строками пачки.
+    """
+    errors = []
+    missing = [field for field in REQUIRED_FIELDS if row.get(field) in (None, '')]
+    if missing:
+        raise ValidationError(f"Не заполнены поля: {', '.join(missing)}")
+
+    fields = {field: row[field] for field in OPTIONAL_FIELDS if row.get(field) not in (None, '')}
+    fields['sku'] = str(row['sku']).strip()
+    fields['name'] = str(row['name']).strip()
+    if len(fields['sku']) > SKU_MAX_LENGTH:
+        errors.append(f"Артикул длиннее {SKU_MAX_LENGTH} символов")
+    if 'slug' in fields:
+        fields['slug'] = str(fields['slug']).strip()
+        try:
+            validate_slug(fields['slug'])
+            if len(fields['slug']) > SLUG_MAX_LENGTH:
+                raise ValidationError('')
+        except ValidationError:
+            errors.append("Некорректный URL-адрес: латиница, цифры, дефис и подчеркивание")
+
+    tree = tree or get_category_tree()
+    schemas = {} if schemas is None else schemas
+    category = str(row['category']).strip()
+    node = tree.get_by_slug(category) or (tree.get(int(category)) if category.isdigit() else None)
+    if node is None:
+        raise ValidationError(f"Категория «{category}» не найдена")
+    fields['category_id'] = node['id']
+
+    try:
+        fields['price'] = Decimal(str(row['price']).strip().replace(',', '.'))
+        if fields['price'] < Decimal('0.01'):
+            errors.append("Цена не может быть меньше 0.01")
+    except InvalidOperation:
+        errors.append("Некорректная цена")
+    if 'quantity' in fields:
+        try:
+            fields['quantity'] = int(fields['quantity'])
+            if fields['quantity'] < 0:
+                raise ValueError
+        except (TypeError, ValueError):
+            errors.append("Количество должно быть неотрицательным целым")
+    if 'is_digital' in fields:
+        try:
+            fields['is_digital'] = _parse_bool(fields['is_digital'])
+        except ValueError:
+            errors.append("Некорректный признак цифрового товара")
+
+    schema = schemas.get(node['id'])
+    if schema is None:
+        schema = schemas[node['id']] = _category_attributes(node['id'])
+    values = {}
+    attributes = row.get('attributes', {})
+    if not isinstance(attributes, dict):
+        errors.append("Атрибуты должны быть JSON-объектом")
+        attributes = {}
+    for key, value in attributes.items():
+        attribute = schema.get(str(key).strip().casefold())
+        # Пустые столбцы атрибутов других категорий - обычное дело в общем CSV
+        if value in (None, ''):
+            if attribute is not None and attribute['is_required']:
+                errors.append(f"«{attribute['name']}»: значение обязательно")
+            continue
+        if attribute is None:
+            errors.append(f"Атрибут «{key}» не относится к категории")
+            continue
+        try:
+            values[attribute['id']] = clean_attribute_value(attribute, value)
+        except ValidationError as e:
+            errors.extend(e.messages)
+
+    if errors:
+        raise ValidationError(errors)
+    return fields, values
+
+
+def _check_conflicts(cleaned, report):
+    """Отбрасывает строки, чье название уже занято в категории другим артикулом"""
+    owners = {
+        (name, category_id): sku
+        for name, category_id, sku in Product.objects.filter(
+            name__in={fields['name'] for _, fields, _ in cleaned.values()}
+        ).values_list('name', 'category_id', 'sku')
+    }
+    for sku, (line, fields, _) in list(cleaned.items()):
+        key = (fields['name'], fields['category_id'])
+        owner = owners.setdefault(key, sku)
+        if owner != sku:
+            report.add_error(line, sku, f"Товар «{fields['name']}» уже есть в категории с артикулом {owner}")
+            del cleaned[sku]
+
+
+def _sku_slug(sku):
+    """Адрес товара из артикула: транслитерация кириллицы, затем slugify"""
+    return slugify(sku.lower().translate(TRANSLIT))[:SLUG_MAX_LENGTH - 10].strip('-') or 'product'
+
+
+def _assign_slugs(cleaned, existing, report):
+    """Адреса товаров без коллизий: по адресу ищется страница товара, а уникальности в базе нет.
+
+    Адрес из фида, занятый другим артикулом, - ошибка строки, как совпадение названий.
+    Новым товарам без адреса он строится из артикула, при занятости - с суффиксом "-2", "-3"...
+    """
+    generated = {sku: _sku_slug(sku) for sku, (_, fields, _) in cleaned.items()
+                 if 'slug' not in fields and sku not in existing}
+    owners = dict(
+        Product.objects.filter(
+            Q(slug__in={fields['slug'] for _, fields, _ in cleaned.values() if 'slug' in fields})
+            | Q(slug__in=set(generated.values()))
+        ).values_list('slug', 'sku')
+    )
+    for sku, (line, fields, _) in list(cleaned.items()):
+        if 'slug' not in fields:
+            continue
+        owner = owners.setdefault(fields['slug'], sku)
+        if owner != sku:
+            report.add_error(line, sku, f"Адрес «{fields['slug']}» уже занят товаром с артикулом {owner}")
+            del cleaned[sku]
+
+    for sku, base in generated.items():
+        slug, suffix = base, 1
+        while slug in owners:
+            if suffix == 1:
+                # Занятые суффиксы базы - одним запросом, коллизии редки
+                for taken in Product.objects.filter(slug__startswith=f'{base}-').values_list('slug', flat=True):
+                    owners.setdefault(taken, None)
+            suffix += 1
+            slug = f'{base}-{suffix}'
+        owners[slug] = sku
+        cleaned[sku][1]['slug'] = slug
+
+
+def _upsert_products(cleaned):
+    """Товары одним INSERT ... ON CONFLICT (sku) на каждый набор присутствующих полей"""
+    batches = {}
+    for _, fields, _ in cleaned.values():
+        present = tuple(field for field in OPTIONAL_FIELDS if field in fields)
+        # Адреса новых товаров назначены в _assign_slugs; у существующих без slug в фиде не меняются
+        product = Product(**fields)
+        # Для новых товаров; у существующих наличие пересчитывается с учетом резерва
+        product.is_available = product.quantity > 0
+        batches.setdefault(present, []).append(product)
+
+    products = []
+    for present, batch in batches.items():
+        update_fields = ['name', 'category', 'price', 'updated_at', *present]
+        products += Product.objects.bulk_create(
+            batch, update_conflicts=True, unique_fields=['sku'], update_fields=update_fields
+        )
+    return {product.sku: product.pk for product in products}
+
+
+def _import_chunk(chunk, report, dry_run):
+    cleaned, tree, schemas = {}, get_category_tree(), {}
+    for line, row in chunk:
+        report.rows += 1
+        if isinstance(row, ValidationError):
+            report.add_error(line, '', '; '.join(row.messages))
+            continue
+        try:
+            fields, values = clean_row(row, tree, schemas)
+        except ValidationError as e:
+            report.add_error(line, row.get('sku'), '; '.join(e.messages))
+            continue
+        previous = cleaned.get(fields['sku'])
+        if previous is not None:
+            report.add_error(previous[0], fields['sku'], f"Артикул повторяется в строке {line}, строка пропущена")
+        cleaned[fields['sku']] = (line, fields, values)
+
+    if not cleaned:
+        return
+    _check_conflicts(cleaned, report)
+    existing = {
+        sku: category_id
+        for sku, category_id in Product.objects.filter(sku__in=cleaned).values_list('sku', 'category_id')
+    }
+    _assign_slugs(cleaned, existing, report)
+    if dry_run:
+        report.updated += sum(1 for sku in cleaned if sku in existing)
+        report.created += sum(1 for sku in cleaned if sku not in existing)
+        return
+
+    try:
+        with transaction.atomic():
+            ids = _upsert_products(cleaned)
+            ProductAttributeValue.objects.bulk_create(
+                [
+                    ProductAttributeValue(product_id=ids[sku], attribute_id=attribute_id, value=value)
+                    for sku, (_, _, values) in cleaned.items()
+                    for attribute_id, value in values.items()
+                ],
+                update_conflicts=True,
+                unique_fields=['product', 'attribute'],
+                update_fields=['value', *ProductAttributeValue.TYPED_FIELDS]
+            )
+            # Массовые операции минуют сигналы: поиск, карточки и версии каталога - явно
+            Product.objects.filter(pk__in=ids.values()).update(
+                is_available=ExpressionWrapper(Q(quantity__gt=F('reserved_quantity')), output_field=BooleanField())
+            )
+            update_search_vector(ids.values())
+            refresh_spec_sheets(ids.values())
+            invalidate_product_cards(ids.values())
+            invalidate_catalog(
+                {fields['category_id'] for _, fields, _ in cleaned.values()} | set(existing.values())
+            )
+    except DatabaseError as e:
+        for sku, (line, _, _) in cleaned.items():
+            report.add_error(line, sku, f"Ошибка записи пачки: {e}")
+        return
+
+    report.updated += sum(1 for sku in cleaned if sku in existing)
+    report.created += sum(1 for sku in cleaned if sku not in existing)
+
+
+def import_feed(rows, chunk_size=IMPORT_CHUNK_SIZE, dry_run=False):
+    """Потоковый импорт фида пачками по chunk_size строк, каждая пачка - в своей транзакции.
+
+    Товары сопоставляются по артикулу, значения атрибутов - по паре (товар, атрибут).
+    Ошибочные строки пропускаются и попадают в отчет. При dry_run только проверка.
+    """
+    report = ImportReport()
+    rows = iter(rows)
+    while chunk := list(islice(rows, chunk_size)):
+        _import_chunk(chunk, report, dry_run)
+    if report.imported and not dry_run:
+        # Новые товары и переносы между категориями меняют счетчики дерева
+        invalidate_category_tree()
+    return report
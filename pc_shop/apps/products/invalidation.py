@@ -0,0 +1,43 @@
+from django.db import transaction
+
+from apps.catalog_config.tree import get_category_tree
+from apps.core.cache import bump_version
+
+# Версия всего каталога (поиск, список без категории) и версии по категориям
+CATALOG_NAMESPACE = 'catalog'
+
+
+def category_namespace(category_id):
+    """Версия товаров поддерева категории"""
+    return f'{CATALOG_NAMESPACE}:category:{category_id}'
+
+
+def catalog_namespace(category_id=None):
+    return category_namespace(category_id) if category_id else CATALOG_NAMESPACE
+
+
+def reviews_namespace(product_id):
+    """Версия отзывов товара (текст, модерация)"""
+    return f'reviews:{product_id}'
+
+
+def invalidate_reviews(product_id):
+    transaction.on_commit(lambda: bump_version(reviews_namespace(product_id)))
+
+
+def invalidate_catalog(category_ids=()):
+    """После фиксации: новая версия каталога и категорий товаров вместе с их предками"""
+    category_ids = set(category_ids)
+
+    def bump():
+        tree = get_category_tree()
+        namespaces = {CATALOG_NAMESPACE}
+        for category_id in category_ids:
+            node = tree.get(category_id)
+            while node is not None:
+                namespaces.add(category_namespace(node['id']))
+                node = tree.get(node['parent_id'])
+        for namespace in namespaces:
+            bump_version(namespace)
+
+    transaction.on_commit(bump)
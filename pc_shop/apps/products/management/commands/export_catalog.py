@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.catalog_config.tree import get_category_tree
+from apps.products.export import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, export_feed
+
+
+class Command(BaseCommand):
+    help = "Выгружает каталог в файл CSV, JSONL или YML потоково, без сборки в памяти"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='yml')
+        parser.add_argument('--category', help="Slug категории (с подкатегориями)")
+        parser.add_argument('--base-url', default='', help="Адрес сайта для ссылок YML, например https://example.com")
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        category_id = None
+        if options['category']:
+            node = get_category_tree().get_by_slug(options['category'])
+            if node is None:
+                raise CommandError(f"Категория {options['category']} не найдена")
+            category_id = node['id']
+
+        feed = export_feed(options['format'], category_id, options['base_url'], options['chunk_size'])
+        with open(options['path'], 'w', encoding='utf-8', newline='') as stream:
+            for chunk in feed:
+                stream.write(chunk)
+
+        self.stdout.write(self.style.SUCCESS(f"Фид записан: {options['path']}"))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from apps.products.models import ProductImage
+from apps.products.thumbnails import generate_thumbnails, stale_images
+
+
+class Command(BaseCommand):
+    help = "Создает миниатюры всех размеров для изображений товаров в пуле процессов"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Пересоздать и уже готовые миниатюры")
+        parser.add_argument('--workers', type=int, help="Число процессов (по умолчанию - по числу ядер)")
+
+    def handle(self, *args, **options):
+        images = ProductImage.objects.exclude(image='') if options['all'] else stale_images()
+
+        def on_error(image_id, message):
+            self.stderr.write(f"Изображение {image_id}: {message}")
+
+        total = generate_thumbnails(images, workers=options['workers'], on_error=on_error)
+        self.stdout.write(self.style.SUCCESS(f"Обработано изображений: {total}"))
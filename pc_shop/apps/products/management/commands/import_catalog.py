@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.products.importer import FEED_ENCODINGS, IMPORT_CHUNK_SIZE, feed_format, import_feed, read_feed
+
+
+class Command(BaseCommand):
+    help = "Импортирует товары и значения атрибутов из фида CSV или JSONL (upsert по артикулу)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'jsonl'])
+        parser.add_argument('--encoding', choices=list(FEED_ENCODINGS), default='utf-8-sig')
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help="Только проверка строк, без записи")
+
+    def handle(self, *args, **options):
+        try:
+            format = options['format'] or feed_format(options['path'])
+        except ValueError as e:
+            raise CommandError(e)
+
+        with open(options['path'], encoding=options['encoding'], newline='') as stream:
+            report = import_feed(
+                read_feed(stream, format),
+                chunk_size=options['chunk_size'],
+                dry_run=options['dry_run']
+            )
+
+        for line, sku, message in report.errors:
+            self.stderr.write(f"Строка {line} ({sku or '-'}): {message}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Строк: {report.rows}, создано: {report.created}, обновлено: {report.updated}, "
+            f"ошибок: {len(report.errors)}"
+        ))
+        if report.imported and not options['dry_run']:
+            self.stdout.write("Похожие товары: rebuild_related_products")
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from apps.products.ratings import rebuild_ratings
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает агрегаты рейтинга товаров по одобренным отзывам"
+
+    def handle(self, *args, **options):
+        total = rebuild_ratings()
+        self.stdout.write(self.style.SUCCESS(f"Товаров с отзывами: {total}"))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from apps.products.models import Product
+from apps.products.related import refresh_related_products
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает таблицу похожих товаров"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--category', help="Slug категории (по умолчанию - все товары)")
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        queryset = Product.objects.order_by('id')
+        if options['category']:
+            queryset = queryset.filter(category__slug=options['category'])
+        ids = list(queryset.values_list('id', flat=True))
+
+        chunk_size = options['chunk_size']
+        for start in range(0, len(ids), chunk_size):
+            refresh_related_products(ids[start:start + chunk_size])
+            self.stdout.write(f"Обработано: {min(start + chunk_size, len(ids))}/{len(ids)}")
+
+        self.stdout.write(self.style.SUCCESS(f"Пересчитано товаров: {len(ids)}"))
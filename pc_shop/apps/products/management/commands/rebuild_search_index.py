@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from apps.products.models import Product
+from apps.products.search import update_search_vector
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает поисковые документы (tsvector) для всех товаров"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        ids = list(Product.objects.order_by('id').values_list('id', flat=True))
+
+        total = 0
+        for start in range(0, len(ids), chunk_size):
+            total += update_search_vector(ids[start:start + chunk_size])
+
+        self.stdout.write(self.style.SUCCESS(f"Проиндексировано товаров: {total}"))
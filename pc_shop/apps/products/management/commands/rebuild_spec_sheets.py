@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from apps.products.specs import refresh_spec_sheets
+
+
+class Command(BaseCommand):
+    help = "Пересобирает готовые характеристики товаров по текущим схемам категорий"
+
+    def handle(self, *args, **options):
+        total = refresh_spec_sheets()
+        self.stdout.write(self.style.SUCCESS(f"Обновлено товаров: {total}"))
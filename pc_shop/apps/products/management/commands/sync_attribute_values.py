@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from apps.products.models import ProductAttributeValue
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает типизированные колонки значений атрибутов из JSON-поля value"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        queryset = ProductAttributeValue.objects.only('id', 'attribute_id', 'value').order_by('id')
+
+        chunk, total = [], 0
+        for pav in queryset.iterator(chunk_size=chunk_size):
+            chunk.append(pav)
+            if len(chunk) >= chunk_size:
+                total += self._flush(chunk)
+                chunk = []
+        total += self._flush(chunk)
+
+        self.stdout.write(self.style.SUCCESS(f"Обновлено значений: {total}"))
+
+    def _flush(self, chunk):
+        if not chunk:
+            return 0
+        ProductAttributeValue.objects.bulk_update(chunk, ['value'])
+        return len(chunk)
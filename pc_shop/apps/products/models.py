@@ -1,19 +1,70 @@
 import re
-from collections import defaultdict
 from django.db import models
 from django.core.exceptions import ValidationError
 from django.template.defaultfilters import time
 from django.utils.html import format_html
 from django.utils.text import slugify
 from django.urls import reverse
-from sorl.thumbnail import get_thumbnail
-from django.db.models import Avg, JSONField
+from django.db.models import ExpressionWrapper, F, JSONField, Prefetch, Q
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator, MaxValueValidator, FileExtensionValidator
 from django.utils.translation import gettext_lazy as _
 
 from apps.catalog_config.models import Category
 
 
+# Атрибут экземпляра Product со списком из не более чем одного изображения
+MAIN_IMAGE_ATTR = 'prefetched_main_image'
+
+CARD_THUMBNAIL_SIZE = '300x300'
+GALLERY_THUMBNAIL_SIZE = '800x800'
+ADMIN_THUMBNAIL_SIZE = '100x100'
+# Размеры, заранее создаваемые apps.products.thumbnails: геометрия -> параметры sorl
+THUMBNAIL_OPTIONS = {
+    CARD_THUMBNAIL_SIZE: {'crop': 'center', 'quality': 85},
+    GALLERY_THUMBNAIL_SIZE: {'upscale': False, 'quality': 90},
+    ADMIN_THUMBNAIL_SIZE: {'crop': 'center', 'quality': 99},
+}
+# Адаптивные варианты для srcset: ширины в каждом формате, размер по умолчанию для sizes
+# и миниатюра THUMBNAIL_OPTIONS, которая остается в <img> для старых браузеров
+RESPONSIVE_VARIANTS = {
+    'card': {
+        'geometry': '{0}x{0}',
+        'widths': (300, 600, 900),
+        'options': {'crop': 'center', 'upscale': False},
+        'sizes': '(min-width: 992px) 25vw, (min-width: 768px) 50vw, 100vw',
+        'fallback': CARD_THUMBNAIL_SIZE,
+    },
+    'gallery': {
+        'geometry': '{0}',
+        'widths': (480, 800, 1200),
+        'options': {'upscale': False},
+        'sizes': '(min-width: 768px) 50vw, 100vw',
+        'fallback': GALLERY_THUMBNAIL_SIZE,
+    },
+}
+# Форматы в порядке предпочтения: браузер берет первый поддерживаемый <source>
+RESPONSIVE_FORMATS = {
+    'avif': {'format': 'AVIF', 'quality': 50},
+    'webp': {'format': 'WEBP', 'quality': 75},
+}
+
+
+def main_image_prefetch(lookup='images'):
+    """Главное (иначе первое) изображение для всей страницы товаров одним запросом"""
+    return Prefetch(
+        lookup,
+        queryset=ProductImage.objects.order_by('product_id', '-is_main', 'id').distinct('product_id'),
+        to_attr=MAIN_IMAGE_ATTR
+    )
+
+
+class ProductQuerySet(models.QuerySet):
+    def with_main_image(self):
+        return self.prefetch_related(main_image_prefetch())
+
+
 class Product(models.Model):
     sku = models.CharField(
         _("Артикул"),
@@ -49,10 +100,12 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     quantity = models.PositiveIntegerField(
-        _("Доступное количество"),
+        _("Количество на складе"),
         default=0,
         validators=[MinValueValidator(0)]
     )
+    # Сумма действующих StockReservation, поддерживается apps.products.stock
+    reserved_quantity = models.PositiveIntegerField(_("В резерве"), default=0, editable=False)
     is_available = models.BooleanField(
         _("Доступен для заказа"),
         default=True,
@@ -63,6 +116,25 @@ class Product(models.Model):
         default=False,
         help_text=_("Не требует физической доставки")
     )
+    # Поддерживается apps.products.search.update_search_vector
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    # Агрегаты одобренных отзывов, поддерживаются apps.products.ratings
+    rating_avg = models.FloatField(_("Средний рейтинг"), default=0, editable=False)
+    rating_count = models.PositiveIntegerField(_("Количество оценок"), default=0, editable=False)
+    rating_1 = models.PositiveIntegerField(_("Оценок 1★"), default=0, editable=False)
+    rating_2 = models.PositiveIntegerField(_("Оценок 2★"), default=0, editable=False)
+    rating_3 = models.PositiveIntegerField(_("Оценок 3★"), default=0, editable=False)
+    rating_4 = models.PositiveIntegerField(_("Оценок 4★"), default=0, editable=False)
+    rating_5 = models.PositiveIntegerField(_("Оценок 5★"), default=0, editable=False)
+
+    # Готовые характеристики для карточки товара, поддерживаются apps.products.specs
+    spec_sheet = JSONField(_("Характеристики"), null=True, blank=True, editable=False)
+
+    objects = ProductQuerySet.as_manager()
+
+    # Поля, которые ведет apps.products.stock, а не сохранение модели
+    STOCK_FIELDS = ('reserved_quantity', 'is_available')
 
     class Meta:
         verbose_name = _("Товар")
@@ -72,34 +144,48 @@ class Product(models.Model):
             models.Index(fields=['category', 'is_available']),
             models.Index(fields=['sku']),
             models.Index(fields=['price']),
+            models.Index(fields=['-rating_avg', '-id'], name='product_rating_idx'),
+            GinIndex(fields=['search_vector'], name='product_search_vector_idx'),
+            GinIndex(fields=['name'], name='product_name_trgm_idx', opclasses=['gin_trgm_ops']),
+            GinIndex(fields=['sku'], name='product_sku_trgm_idx', opclasses=['gin_trgm_ops']),
         ]
 
+    # Категория на момент загрузки: перенос товара меняет счетчики дерева категорий
+    loaded_category_id = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.loaded_category_id = instance.__dict__.get('category_id')
+        return instance
+
     def __str__(self):
         return f"{self.name} ({self.sku})"
 
 
     def main_image(self):
-        return self.images.filter(is_main=True).first() or self.images.first()
+        if not hasattr(self, MAIN_IMAGE_ATTR):
+            prefetched = getattr(self, '_prefetched_objects_cache', {}).get('images')
+            if prefetched is not None:
+                image = min(prefetched, key=lambda i: (not i.is_main, i.pk), default=None)
+            else:
+                image = self.images.order_by('-is_main', 'id').first()
+            setattr(self, MAIN_IMAGE_ATTR, [image] if image else [])
+        images = getattr(self, MAIN_IMAGE_ATTR)
+        return images[0] if images else None
 
 
     def attributes_by_group(self):
-        attributes = self.attributes.select_related(
-            'attribute__groups'
-        ).prefetch_related(
-            'attribute__groups__category'
-        )
-
-        groups = defaultdict(list)
-        for attr_value in attributes:
-            for group in attr_value.attribute.groups.all():
-                groups[group].append(attr_value)
-        return sorted(groups.items(), key=lambda x: x[0].name)
+        from apps.products.specs import get_spec_sheet
+        return get_spec_sheet(self)
 
     @property
     def average_rating(self):
-        return self.reviews.filter(approved=True).aggregate(
-            avg=Avg('rating')
-        )['avg'] or 0.00
+        return self.rating_avg
+
+    @property
+    def rating_histogram(self):
+        return {star: getattr(self, f'rating_{star}') for star in range(5, 0, -1)}
 
     def clean(self):
         if not self.sku:
@@ -115,9 +201,34 @@ class Product(models.Model):
         if not self.sku:
             self.sku = f"PRD-{self.category.id}-{int(time.time())}"
 
-        self.is_available = self.quantity > 0
+        if self._state.adding:
+            self.is_available = self.quantity > self.reserved_quantity
+            super().save(*args, **kwargs)
+            return
+
+        # Резерв и наличие меняются условными UPDATE параллельно (apps.products.stock):
+        # сохранение не перезаписывает их значениями из памяти
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.STOCK_FIELDS
+            ]
+        else:
+            kwargs['update_fields'] = [name for name in update_fields if name not in self.STOCK_FIELDS]
         super().save(*args, **kwargs)
 
+        if update_fields is None or 'quantity' in update_fields:
+            Product.objects.filter(pk=self.pk).update(
+                is_available=ExpressionWrapper(Q(reserved_quantity__lt=F('quantity')), output_field=models.BooleanField())
+            )
+            self.refresh_from_db(fields=self.STOCK_FIELDS)
+
+    @property
+    def available_quantity(self):
+        """Остаток для заказа: на складе за вычетом резерва корзин"""
+        return max(self.quantity - self.reserved_quantity, 0)
+
     def get_absolute_url(self):
         return reverse('product_detail', kwargs={'product_slug': self.slug})
 
@@ -132,6 +243,9 @@ class ProductImage(models.Model):
         upload_to='products/gallery/',
     )
     is_main = models.BooleanField(_("Главное изображение"), default=False)
+    # {'source': имя исходного файла, геометрия: {'url', 'width', 'height'},
+    #  'variants': {вариант: {формат: [{'url', 'width'}, ...]}}}
+    thumbnails = JSONField(_("Миниатюры"), default=dict, blank=True, editable=False)
 
     class Meta:
         verbose_name = _("Изображение товара")
@@ -146,14 +260,45 @@ class ProductImage(models.Model):
 
     def preview_thumbnail(self):
         if self.image:
-            thumb = get_thumbnail(self.image, '100x100', crop='center', quality=99)
+            thumb = self.get_thumbnail(ADMIN_THUMBNAIL_SIZE)
+            if thumb is None:
+                return format_html('<img src="{}" width="100"/>', self.image.url)
             return format_html(
-                f'<img src="{thumb.url}" width="{thumb.width}" height="{thumb.height}"/>'
+                '<img src="{}" width="{}" height="{}"/>', thumb['url'], thumb['width'], thumb['height']
             )
         return "-"
 
     preview_thumbnail.short_description = _("Превью")
 
+    def get_thumbnail(self, geometry):
+        """Готовая миниатюра текущего файла или None, если она еще не создана"""
+        if self.thumbnails.get('source') != self.image.name:
+            return None
+        return self.thumbnails.get(geometry)
+
+    def get_thumbnail_url(self, geometry=CARD_THUMBNAIL_SIZE):
+        """URL готовой миниатюры; пока ее нет - исходный файл, без ресайза во время запроса"""
+        if not self.image:
+            return ''
+        thumb = self.get_thumbnail(geometry)
+        return thumb['url'] if thumb else self.image.url
+
+    def get_gallery_url(self):
+        return self.get_thumbnail_url(GALLERY_THUMBNAIL_SIZE)
+
+    def get_sources(self, variant):
+        """<source> для варианта RESPONSIVE_VARIANTS: [{'type', 'srcset'}] в порядке предпочтения форматов"""
+        if not self.image or self.thumbnails.get('source') != self.image.name:
+            return []
+        variants = self.thumbnails.get('variants', {}).get(variant, {})
+        return [
+            {
+                'type': f'image/{format}',
+                'srcset': ', '.join(f"{thumb['url']} {thumb['width']}w" for thumb in variants[format]),
+            }
+            for format in RESPONSIVE_FORMATS if variants.get(format)
+        ]
+
     def save(self, *args, **kwargs):
         if self.is_main:
             ProductImage.objects.filter(
@@ -195,15 +340,47 @@ class Review(models.Model):
             )
         ]
 
+    # Состояние, уже учтенное в агрегатах товара (новый отзыв еще не учтен)
+    counted_rating = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.counted_rating = instance.get_counted_rating()
+        return instance
+
     def __str__(self):
         return f"{self.user.username} - {self.product.name} ({self.rating})"
 
+    def get_counted_rating(self):
+        """(товар, оценка), если отзыв учитывается в рейтинге товара"""
+        if self.approved and self.product_id and self.rating:
+            return self.product_id, int(self.rating)
+        return None
+
     def clean(self):
         if not 1 <= self.rating <= 5:
             raise ValidationError(_("Рейтинг должен быть от 1 до 5"))
 
 
+class ProductAttributeValueQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        ProductAttributeValue.fill_typed_values_bulk(objs)
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        fields = list(fields)
+        if 'value' in fields:
+            ProductAttributeValue.fill_typed_values_bulk(objs)
+            fields += [f for f in ProductAttributeValue.TYPED_FIELDS if f not in fields]
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+
 class ProductAttributeValue(models.Model):
+    TYPED_FIELDS = ('value_number', 'value_string', 'value_boolean', 'value_option')
+
     product = models.ForeignKey(
         Product,
         related_name='attributes',
@@ -216,11 +393,37 @@ class ProductAttributeValue(models.Model):
     )
     value = JSONField(_("Значение"))
 
+    # Типизированные копии value для индексируемой фильтрации
+    value_number = models.FloatField(_("Числовое значение"), null=True, blank=True, editable=False)
+    value_string = models.CharField(
+        _("Строковое значение"),
+        max_length=255,
+        null=True,
+        blank=True,
+        editable=False
+    )
+    value_boolean = models.BooleanField(_("Логическое значение"), null=True, blank=True, editable=False)
+    value_option = models.ForeignKey(
+        'catalog_config.EnumOption',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name='+',
+        verbose_name=_("Вариант списка")
+    )
+
+    objects = ProductAttributeValueQuerySet.as_manager()
+
     class Meta:
         unique_together = ('product', 'attribute')
         indexes = [
             models.Index(fields=['attribute']),
             models.Index(fields=['product']),
+            models.Index(fields=['attribute', 'value_number'], include=['product'], name='pav_attr_number_idx'),
+            models.Index(fields=['attribute', 'value_string'], include=['product'], name='pav_attr_string_idx'),
+            models.Index(fields=['attribute', 'value_boolean'], include=['product'], name='pav_attr_boolean_idx'),
+            models.Index(fields=['attribute', 'value_option'], include=['product'], name='pav_attr_option_idx'),
         ]
 
     def clean(self):
@@ -249,5 +452,121 @@ class ProductAttributeValue(models.Model):
             if val not in valid_values:
                 raise ValidationError(_("Недопустимое значение для списка"))
 
+    def fill_typed_values(self, data_type=None, enum_options=None):
+        """Заполнение типизированных колонок из JSON-значения"""
+        data_type = data_type or self.attribute.data_type
+        val = self.value
+        self.value_number = None
+        self.value_string = None
+        self.value_boolean = None
+        self.value_option_id = None
+
+        if val is None:
+            return
+
+        if data_type == 'number':
+            if not isinstance(val, bool):
+                try:
+                    self.value_number = float(val)
+                except (TypeError, ValueError):
+                    pass
+        elif data_type == 'boolean':
+            if isinstance(val, str):
+                val = val.lower() in ('true', '1')
+            self.value_boolean = bool(val)
+        elif data_type == 'enum':
+            if enum_options is None:
+                self.value_option_id = self.attribute.enum_options.filter(
+                    value=str(val)
+                ).values_list('id', flat=True).first()
+            else:
+                self.value_option_id = enum_options.get((self.attribute_id, str(val)))
+        else:
+            self.value_string = str(val)[:255]
+
+    @classmethod
+    def fill_typed_values_bulk(cls, objs):
+        """Заполнение типизированных колонок для пачки значений без запросов на каждую строку"""
+        from apps.catalog_config.models import Attribute, EnumOption
+
+        attribute_ids = {obj.attribute_id for obj in objs}
+        data_types = dict(
+            Attribute.objects.filter(id__in=attribute_ids).values_list('id', 'data_type')
+        )
+        enum_options = {
+            (attribute_id, value): option_id
+            for option_id, attribute_id, value in EnumOption.objects.filter(
+                attribute_id__in=[pk for pk, data_type in data_types.items() if data_type == 'enum']
+            ).values_list('id', 'attribute_id', 'value')
+        }
+        for obj in objs:
+            obj.fill_typed_values(data_types.get(obj.attribute_id), enum_options)
+
+    def save(self, *args, **kwargs):
+        self.fill_typed_values()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'value' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | set(self.TYPED_FIELDS)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.attribute.name}: {self.value}"
+
+
+class RelatedProduct(models.Model):
+    """Предрасчитанные похожие товары (см. apps.products.related)"""
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='related_links'
+    )
+    related = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='related_from',
+        verbose_name=_("Похожий товар")
+    )
+    score = models.FloatField(_("Оценка схожести"), default=0)
+    rank = models.PositiveSmallIntegerField(_("Позиция"), default=0)
+
+    class Meta:
+        verbose_name = _("Похожий товар")
+        verbose_name_plural = _("Похожие товары")
+        ordering = ['rank']
+        unique_together = ('product', 'related')
+        indexes = [
+            models.Index(fields=['product', 'rank']),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.related_id} ({self.score:.2f})"
+
+
+class StockReservation(models.Model):
+    """Резерв товара позицией корзины до expires_at (см. apps.products.stock)"""
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='reservations'
+    )
+    # Позиция, удаленная в обход apps.products.stock, оставляет резерв до истечения срока
+    cart_item = models.OneToOneField(
+        'cart.CartItem',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='reservation'
+    )
+    quantity = models.PositiveIntegerField(_("Количество"))
+    expires_at = models.DateTimeField(_("Действует до"))
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = _("Резерв товара")
+        verbose_name_plural = _("Резервы товаров")
+        indexes = [
+            models.Index(fields=['expires_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}: {self.quantity} до {self.expires_at:%d.%m.%Y %H:%M}"
@@ -0,0 +1,194 @@
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core import signing
+from django.core.paginator import Paginator
+from django.db.models import FloatField, Q, Value
+from django.http import Http404
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+
+from apps.products.counts import ResultCount, get_exact_count, get_result_count, normalize_filter_key
+
+CURSOR_SALT = 'products.cursor'
+
+# Порядок сортировки каталога; последний столбец - уникальный тай-брейк для курсора
+SORT_ORDERINGS = {
+    'default': ('id',),
+    'price_asc': ('price', 'id'),
+    'price_desc': ('-price', '-id'),
+    'newest': ('-created_at', '-id'),
+    'top_rated': ('-rating_avg', '-id'),
+}
+
+# Вычисляемые столбцы, на которые ссылаются сортировки
+SORT_ANNOTATIONS = {
+    # Релевантность задается поиском; без запроса все строки равнозначны
+    'rank': lambda: Value(0.0, output_field=FloatField()),
+}
+
+
+def encode_cursor(values):
+    """Непрозрачный подписанный токен из значений ключа сортировки последней строки"""
+    prepared = []
+    for value in values:
+        if isinstance(value, (datetime, date)):
+            value = value.isoformat()
+        elif isinstance(value, Decimal):
+            value = str(value)
+        prepared.append(value)
+    return signing.dumps(prepared, salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(token, size):
+    try:
+        values = signing.loads(token, salt=CURSOR_SALT)
+    except signing.BadSignature:
+        raise Http404(_("Неверный курсор страницы"))
+    if not isinstance(values, list) or len(values) != size:
+        raise Http404(_("Неверный курсор страницы"))
+    return values
+
+
+def keyset_filter(ordering, values):
+    """Условие "строго после курсора" для составного ключа сортировки"""
+    condition = Q()
+    equal = Q()
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        condition |= equal & Q(**{f'{name}__{lookup}': value})
+        equal &= Q(**{name: value})
+    return condition
+
+
+class CursorPage:
+    """Страница курсорной пагинации: стоимость выборки не зависит от глубины"""
+    number = None
+
+    def __init__(self, object_list, cursor, next_cursor):
+        self.object_list = object_list
+        self.cursor = cursor
+        self.next_cursor = next_cursor
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return bool(self.cursor)
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CountingPaginator(Paginator):
+    """Paginator с кэшированным по ключу фильтров COUNT(*)"""
+
+    def __init__(self, *args, count_key=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.count_key = count_key
+
+    @cached_property
+    def count(self):
+        return get_exact_count(self.object_list, self.count_key)
+
+    @cached_property
+    def result_count(self):
+        # Пагинатор уже посчитал точно - оценка планировщика не нужна
+        return ResultCount(self.count)
+
+
+class KeysetPaginator:
+    def __init__(self, queryset, per_page, ordering):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = ordering
+
+    def page(self, cursor=None):
+        queryset = self.queryset.order_by(*self.ordering)
+        if cursor:
+            queryset = queryset.filter(
+                keyset_filter(self.ordering, decode_cursor(cursor, len(self.ordering)))
+            )
+
+        rows = list(queryset[:self.per_page + 1])
+        next_cursor = None
+        if len(rows) > self.per_page:
+            rows = rows[:self.per_page]
+            last = rows[-1]
+            next_cursor = encode_cursor(
+                [getattr(last, field.lstrip('-')) for field in self.ordering]
+            )
+        return CursorPage(rows, cursor, next_cursor)
+
+
+class KeysetPaginationMixin:
+    """Сортировка по ?sort= и курсорный режим пагинации по ?cursor= для ListView"""
+    cursor_param = 'cursor'
+    sort_param = 'sort'
+    sort_orderings = SORT_ORDERINGS
+    paginator_class = CountingPaginator
+
+    def get_count_key(self):
+        return normalize_filter_key(self.request.path, self.request.GET)
+
+    def get_paginator(self, queryset, per_page, orphans=0, allow_empty_first_page=True, **kwargs):
+        return self.paginator_class(
+            queryset,
+            per_page,
+            orphans=orphans,
+            allow_empty_first_page=allow_empty_first_page,
+            count_key=self.get_count_key(),
+            **kwargs
+        )
+
+    def get_result_count(self, paginator, queryset):
+        """Количество берется у пагинатора; в курсорном режиме точного подсчета нет - оценка"""
+        if paginator is not None:
+            return paginator.result_count
+        return get_result_count(queryset, self.get_count_key())
+
+    def get_sort_key(self):
+        sort = self.request.GET.get(self.sort_param)
+        return sort if sort in self.sort_orderings else 'default'
+
+    def get_sort_ordering(self):
+        return self.sort_orderings[self.get_sort_key()]
+
+    def sort_queryset(self, queryset):
+        ordering = self.get_sort_ordering()
+        annotations = {
+            name: SORT_ANNOTATIONS[name]()
+            for name in (field.lstrip('-') for field in ordering)
+            if name in SORT_ANNOTATIONS and name not in queryset.query.annotations
+        }
+        if annotations:
+            queryset = queryset.annotate(**annotations)
+        return queryset.order_by(*ordering)
+
+    def is_cursor_mode(self):
+        return self.cursor_param in self.request.GET
+
+    def paginate_queryset(self, queryset, page_size):
+        queryset = self.sort_queryset(queryset)
+        if not self.is_cursor_mode():
+            return super().paginate_queryset(queryset, page_size)
+
+        paginator = KeysetPaginator(queryset, page_size, self.get_sort_ordering())
+        page = paginator.page(self.request.GET.get(self.cursor_param))
+        return None, page, page.object_list, page.has_other_pages()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['cursor_pagination'] = self.is_cursor_mode()
+        context['result_count'] = self.get_result_count(context.get('paginator'), self.object_list)
+        return context
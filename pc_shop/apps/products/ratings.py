@@ -0,0 +1,70 @@
+from collections import Counter, defaultdict
+
+from django.db.models import Count, F, FloatField, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+from apps.products.models import Product, Review
+
+STARS = range(1, 6)
+RATING_FIELDS = ['rating_avg', 'rating_count'] + [f'rating_{star}' for star in STARS]
+
+
+def apply_rating_changes(changes):
+    """Инкрементальное обновление агрегатов: changes - Counter {(product_id, оценка): дельта}"""
+    by_product = defaultdict(dict)
+    for (product_id, star), delta in changes.items():
+        if delta:
+            by_product[product_id][star] = delta
+
+    for product_id, deltas in by_product.items():
+        # Один UPDATE: новые значения корзин выражены через старые
+        buckets = {star: F(f'rating_{star}') + deltas.get(star, 0) for star in STARS}
+        count = sum(buckets.values(), Value(0))
+        total = sum((star * bucket for star, bucket in buckets.items()), Value(0))
+        Product.objects.filter(pk=product_id).update(
+            rating_count=count,
+            rating_avg=Coalesce(
+                Cast(total, FloatField()) / NullIf(Cast(count, FloatField()), Value(0.0)),
+                Value(0.0),
+                output_field=FloatField()
+            ),
+            **{f'rating_{star}': bucket for star, bucket in buckets.items() if star in deltas}
+        )
+
+
+def review_rating_changes(old, new):
+    changes = Counter()
+    if old:
+        changes[old] -= 1
+    if new:
+        changes[new] += 1
+    return changes
+
+
+def rebuild_ratings(product_ids=None):
+    """Полный пересчет агрегатов по одобренным отзывам"""
+    reviews = Review.objects.filter(approved=True)
+    products = Product.objects.all()
+    if product_ids is not None:
+        reviews = reviews.filter(product_id__in=product_ids)
+        products = products.filter(pk__in=product_ids)
+
+    histograms = defaultdict(dict)
+    for row in reviews.values('product_id', 'rating').annotate(n=Count('id')).order_by():
+        histograms[row['product_id']][row['rating']] = row['n']
+
+    # Товары без одобренных отзывов
+    products.filter(rating_count__gt=0).exclude(pk__in=list(histograms)).update(
+        rating_avg=0, rating_count=0, **{f'rating_{star}': 0 for star in STARS}
+    )
+
+    updated = []
+    for product_id, histogram in histograms.items():
+        product = Product(pk=product_id)
+        product.rating_count = sum(histogram.values())
+        product.rating_avg = sum(star * n for star, n in histogram.items()) / product.rating_count
+        for star in STARS:
+            setattr(product, f'rating_{star}', histogram.get(star, 0))
+        updated.append(product)
+    Product.objects.bulk_update(updated, RATING_FIELDS, batch_size=1000)
+    return len(updated)
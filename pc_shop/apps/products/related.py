@@ -0,0 +1,107 @@
+from django.db import transaction
+from django.db.models import Count, Q
+
+from apps.products.models import Product, ProductAttributeValue, RelatedProduct
+
+# Сколько соседей храним на товар
+RELATED_PRODUCTS_LIMIT = 8
+# Ограничение кандидатов на каждый сигнал
+CANDIDATE_LIMIT = 200
+
+CATEGORY_WEIGHT = 1.0
+ATTRIBUTE_WEIGHT = 2.0
+COPURCHASE_WEIGHT = 3.0
+
+
+def _attribute_similarity(product):
+    """Доля совпадающих значений атрибутов у товаров той же категории"""
+    pairs = list(
+        ProductAttributeValue.objects.filter(product=product).values_list(
+            'attribute_id', *ProductAttributeValue.TYPED_FIELDS
+        )
+    )
+    if not pairs:
+        return {}
+
+    condition = Q()
+    for attribute_id, number, string, boolean, option_id in pairs:
+        condition |= Q(
+            attribute_id=attribute_id,
+            value_number=number,
+            value_string=string,
+            value_boolean=boolean,
+            value_option_id=option_id
+        )
+
+    shared = ProductAttributeValue.objects.filter(
+        condition,
+        product__category_id=product.category_id
+    ).exclude(
+        product=product
+    ).values('product').annotate(
+        shared=Count('id')
+    ).order_by('-shared')[:CANDIDATE_LIMIT]
+
+    return {row['product']: row['shared'] / len(pairs) for row in shared}
+
+
+def _copurchase_scores(product):
+    """Нормированная частота совместных покупок"""
+    from apps.orders.models import OrderItem
+
+    rows = OrderItem.objects.filter(
+        order__items__product=product,
+        product__isnull=False
+    ).exclude(
+        product=product
+    ).values('product').annotate(
+        orders=Count('order', distinct=True)
+    ).order_by('-orders')[:CANDIDATE_LIMIT]
+
+    rows = list(rows)
+    if not rows:
+        return {}
+    top = rows[0]['orders']
+    return {row['product']: row['orders'] / top for row in rows}
+
+
+def compute_related_products(product):
+    """Топ соседей товара: категория + схожесть атрибутов + совместные покупки"""
+    scores = {}
+
+    same_category = Product.objects.filter(
+        category_id=product.category_id,
+        is_available=True
+    ).exclude(pk=product.pk).order_by('-created_at').values_list('pk', flat=True)[:RELATED_PRODUCTS_LIMIT]
+    for pk in same_category:
+        scores[pk] = CATEGORY_WEIGHT
+
+    for pk, similarity in _attribute_similarity(product).items():
+        scores[pk] = CATEGORY_WEIGHT + ATTRIBUTE_WEIGHT * similarity
+
+    for pk, frequency in _copurchase_scores(product).items():
+        scores[pk] = scores.get(pk, 0) + COPURCHASE_WEIGHT * frequency
+
+    return sorted(scores.items(), key=lambda item: (-item[1], -item[0]))[:RELATED_PRODUCTS_LIMIT]
+
+
+def refresh_related_products(product_ids):
+    """Пересчет таблицы похожих товаров для указанных товаров"""
+    for product in Product.objects.filter(pk__in=product_ids).only('pk', 'category_id'):
+        links = [
+            RelatedProduct(product=product, related_id=related_id, score=score, rank=rank)
+            for rank, (related_id, score) in enumerate(compute_related_products(product))
+        ]
+        with transaction.atomic():
+            RelatedProduct.objects.filter(product=product).delete()
+            RelatedProduct.objects.bulk_create(links)
+
+
+def refresh_category_neighbours(product):
+    """Добавленный товар должен попасть в соседи товаров категории с неполным списком"""
+    incomplete = Product.objects.filter(
+        category_id=product.category_id
+    ).exclude(pk=product.pk).annotate(
+        links=Count('related_links')
+    ).filter(links__lt=RELATED_PRODUCTS_LIMIT).values_list('pk', flat=True)[:CANDIDATE_LIMIT]
+    refresh_related_products(list(incomplete))
@@ -0,0 +1,153 @@
+import re
+
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+    TrigramSimilarity,
+    TrigramWordSimilarity,
+)
+from django.core.cache import cache
+from django.db.models import CharField, F, OuterRef, Q, Subquery
+from django.db.models.functions import Cast, Coalesce, Greatest
+from django.urls import reverse
+
+from apps.catalog_config.models import Category
+from apps.products.models import Product, ProductAttributeValue
+
+# Названия товаров русские - стемминг по русскому словарю
+SEARCH_CONFIG = 'russian'
+# Артикулы не стеммим
+SKU_SEARCH_CONFIG = 'simple'
+
+SEARCH_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+AUTOCOMPLETE_LIMIT = 8
+AUTOCOMPLETE_MAX_LIMIT = 20
+AUTOCOMPLETE_MIN_LENGTH = 2
+AUTOCOMPLETE_MAX_LENGTH = 64
+# Кэшируем только короткие (самые частые) префиксы
+AUTOCOMPLETE_CACHE_PREFIX_LENGTH = 4
+AUTOCOMPLETE_CACHE_TIMEOUT = 60 * 5
+
+
+def build_search_vector():
+    """Выражение документа товара: название и SKU (A), путь категории (B), атрибуты (C), описание (D)"""
+    category_path = Subquery(
+        Category.objects.filter(pk=OuterRef('category_id')).values('path')[:1]
+    )
+    attribute_text = Subquery(
+        ProductAttributeValue.objects.filter(
+            product=OuterRef('pk')
+        ).order_by().values('product').annotate(
+            text=StringAgg(
+                Coalesce(
+                    'value_string',
+                    'value_option__value',
+                    Cast('value_number', output_field=CharField())
+                ),
+                delimiter=' '
+            )
+        ).values('text')[:1]
+    )
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG) +
+        SearchVector('sku', weight='A', config=SKU_SEARCH_CONFIG) +
+        SearchVector(category_path, weight='B', config=SEARCH_CONFIG) +
+        SearchVector(attribute_text, weight='C', config=SEARCH_CONFIG) +
+        SearchVector('description', weight='D', config=SEARCH_CONFIG)
+    )
+
+
+def update_search_vector(products=None):
+    """Пересчет поискового документа для товаров (id, queryset или все товары)"""
+    queryset = Product.objects.all()
+    if products is not None:
+        queryset = queryset.filter(pk__in=products)
+    return queryset.update(search_vector=build_search_vector())
+
+
+def build_search_query(query):
+    """Префиксный tsquery: каждое слово запроса ищется как начало лексемы"""
+    tokens = SEARCH_TOKEN_RE.findall(query.lower())
+    if not tokens:
+        return None
+    raw = ' & '.join(f'{token}:*' for token in tokens)
+    return (
+        SearchQuery(raw, config=SEARCH_CONFIG, search_type='raw') |
+        SearchQuery(raw, config=SKU_SEARCH_CONFIG, search_type='raw')
+    )
+
+
+def search_products(queryset, query):
+    """Полнотекстовый поиск по GIN-индексу с сортировкой по ts_rank"""
+    query = (query or '').strip()
+    search_query = build_search_query(query)
+    if search_query is None:
+        return queryset.none()
+
+    return queryset.filter(
+        Q(search_vector=search_query) | Q(sku__in={query, query.upper()})
+    ).annotate(
+        rank=SearchRank(F('search_vector'), search_query)
+    ).order_by('-rank', '-id')
+
+
+def normalize_autocomplete_term(term):
+    return ' '.join((term or '').lower().split())[:AUTOCOMPLETE_MAX_LENGTH]
+
+
+def autocomplete(term, limit=AUTOCOMPLETE_LIMIT):
+    """Подсказки по товарам, артикулам и категориям с учетом опечаток (pg_trgm)"""
+    term = normalize_autocomplete_term(term)
+    limit = max(1, min(limit, AUTOCOMPLETE_MAX_LIMIT))
+    if len(term) < AUTOCOMPLETE_MIN_LENGTH:
+        return {'query': term, 'products': [], 'categories': []}
+
+    cache_key = None
+    if len(term) <= AUTOCOMPLETE_CACHE_PREFIX_LENGTH:
+        cache_key = f'autocomplete:{limit}:{term}'
+        suggestions = cache.get(cache_key)
+        if suggestions is not None:
+            return suggestions
+
+    # Операторы <% и LIKE обслуживаются GIN-индексами gin_trgm_ops
+    products = Product.objects.filter(
+        Q(name__trigram_word_similar=term) | Q(sku__contains=term.upper())
+    ).annotate(
+        similarity=Greatest(
+            TrigramWordSimilarity(term, 'name'),
+            TrigramSimilarity('sku', term.upper())
+        )
+    ).order_by('-similarity', 'name').values('name', 'sku', 'slug')[:limit]
+
+    categories = Category.objects.filter(
+        name__trigram_word_similar=term
+    ).annotate(
+        similarity=TrigramWordSimilarity(term, 'name')
+    ).order_by('-similarity', 'name').values('name', 'slug', 'path')[:limit]
+
+    suggestions = {
+        'query': term,
+        'products': [
+            {
+                'name': product['name'],
+                'sku': product['sku'],
+                'url': reverse('product_detail', kwargs={'product_slug': product['slug']}),
+            }
+            for product in products
+        ],
+        'categories': [
+            {
+                'name': category['name'],
+                'path': category['path'],
+                'url': reverse('product_list_by_category', kwargs={'category_slug': category['slug']}),
+            }
+            for category in categories
+        ],
+    }
+
+    if cache_key:
+        cache.set(cache_key, suggestions, AUTOCOMPLETE_CACHE_TIMEOUT)
+    return suggestions
@@ -0,0 +1,227 @@
+from django.db import connections, transaction
+from django.db.models.signals import m2m_changed, post_save, post_delete
+from django.dispatch import receiver
+
+from apps.catalog_config.models import Attribute, AttributeGroup, AttributeGroupLink, Category
+from apps.catalog_config.tree import get_category_tree, invalidate_category_tree
+from apps.products.cards import invalidate_product_cards
+from apps.products.models import Product, ProductAttributeValue, ProductImage, Review
+from apps.products.ratings import apply_rating_changes, review_rating_changes
+from apps.products.related import refresh_category_neighbours, refresh_related_products
+from apps.products.invalidation import invalidate_catalog, invalidate_reviews
+from apps.products.search import update_search_vector
+from apps.products.specs import refresh_branch_spec_sheets, refresh_spec_sheets
+from apps.products.tasks import schedule_thumbnails
+
+SEARCH_FIELDS = {'name', 'sku', 'description', 'category', 'category_id'}
+# Соседи товара считаются в пределах категории (apps.products.related)
+RELATED_FIELDS = {'category', 'category_id'}
+# Атрибут соединения с товарами, чьи атрибуты изменены в текущей транзакции
+PENDING_ATTRIBUTE_PRODUCTS = 'pending_attribute_products'
+# Атрибут соединения с категориями и атрибутами, чьи схемы изменены в текущей транзакции
+PENDING_SPEC_SHEETS = 'pending_spec_sheets'
+
+
+def create_trigram_extension(using, **kwargs):
+    """pg_trgm нужен триграммным индексам товаров и категорий до применения миграций"""
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+
+def schedule_search_update(products):
+    """Обновление поискового документа после фиксации транзакции"""
+    transaction.on_commit(lambda: update_search_vector(products))
+
+
+@receiver(post_save, sender=Product)
+def update_product_search_vector(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not SEARCH_FIELDS & set(update_fields):
+        return
+    schedule_search_update([instance.pk])
+
+
+@receiver(post_save, sender=Product)
+def update_related_products(sender, instance, created=False, update_fields=None, **kwargs):
+    # Частичные сохранения (остатки, цена) на соседей не влияют
+    if update_fields is not None and not RELATED_FIELDS & set(update_fields):
+        return
+
+    def refresh():
+        refresh_related_products([instance.pk])
+        if created:
+            refresh_category_neighbours(instance)
+
+    transaction.on_commit(refresh)
+
+
+@receiver(post_save, sender=Product)
+def update_category_tree_counts(sender, instance, created=False, **kwargs):
+    # Счетчики дерева зависят только от привязки товара к категории
+    if created or instance.category_id != instance.loaded_category_id:
+        invalidate_category_tree()
+        # Прежняя категория тоже теряет товар
+        if instance.loaded_category_id:
+            invalidate_catalog([instance.loaded_category_id])
+    instance.loaded_category_id = instance.category_id
+
+
+@receiver(post_delete, sender=Product)
+def update_category_tree_on_delete(sender, instance, **kwargs):
+    invalidate_category_tree()
+
+
+@receiver(post_save, sender=Category)
+def update_category_search_vector(sender, instance, created=False, **kwargs):
+    if created:
+        return
+    # Путь категории входит в документ товаров всего поддерева
+    schedule_search_update(
+        Product.objects.filter(category__in=instance.get_descendants(include_self=True)).values('pk')
+    )
+
+
+@receiver(post_save, sender=Review)
+def update_product_rating_on_save(sender, instance, **kwargs):
+    counted = instance.get_counted_rating()
+    changes = review_rating_changes(instance.counted_rating, counted)
+    apply_rating_changes(changes)
+    instance.counted_rating = counted
+    invalidate_reviews(instance.product_id)
+    if changes:
+        invalidate_rated_product(instance.product_id)
+
+
+@receiver(post_delete, sender=Review)
+def update_product_rating_on_delete(sender, instance, **kwargs):
+    changes = review_rating_changes(instance.counted_rating, None)
+    apply_rating_changes(changes)
+    invalidate_reviews(instance.product_id)
+    if changes:
+        invalidate_rated_product(instance.product_id)
+
+
+def invalidate_rated_product(product_id):
+    # Агрегаты обновляются UPDATE без сигналов товара
+    invalidate_product_cards([product_id])
+    invalidate_catalog(Product.objects.filter(pk=product_id).values_list('category_id', flat=True))
+
+
+@receiver([post_save, post_delete], sender=Product)
+def update_catalog_version(sender, instance, **kwargs):
+    # Цена, остатки, атрибуты: версии каталога для снимков и кэша страниц
+    invalidate_catalog([instance.category_id])
+
+
+@receiver([post_save, post_delete], sender=Product)
+def update_product_card_version(sender, instance, **kwargs):
+    invalidate_product_cards([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=ProductImage)
+def update_product_card_version_on_image(sender, instance, **kwargs):
+    invalidate_product_cards([instance.product_id])
+    invalidate_catalog(Product.objects.filter(pk=instance.product_id).values_list('category_id', flat=True))
+
+
+def refresh_attribute_products(product_ids):
+    """Производные данные товаров после изменения значений атрибутов"""
+    update_search_vector(product_ids)
+    refresh_related_products(product_ids)
+    refresh_spec_sheets(product_ids)
+    invalidate_catalog(Product.objects.filter(pk__in=product_ids).values_list('category_id', flat=True))
+
+
+def _is_scheduled(connection, callback):
+    # Откат транзакции или точки сохранения снимает зарегистрированные колбэки
+    return any(func is callback for _, func, _ in connection.run_on_commit)
+
+
+@receiver([post_save, post_delete], sender=ProductAttributeValue)
+def update_attribute_products(sender, instance, **kwargs):
+    # Сохранение товара с N значениями в админке - одна обработка товара после фиксации, а не N
+    connection = transaction.get_connection()
+    pending = getattr(connection, PENDING_ATTRIBUTE_PRODUCTS, None)
+    if pending is not None and _is_scheduled(connection, pending['flush']):
+        pending['product_ids'].add(instance.product_id)
+        return
+
+    product_ids = {instance.product_id}
+
+    def flush():
+        setattr(connection, PENDING_ATTRIBUTE_PRODUCTS, None)
+        refresh_attribute_products(product_ids)
+
+    setattr(connection, PENDING_ATTRIBUTE_PRODUCTS, {'product_ids': product_ids, 'flush': flush})
+    transaction.on_commit(flush)
+
+
+@receiver(post_save, sender=ProductImage)
+def generate_product_image_thumbnails(sender, instance, **kwargs):
+    # Все размеры создаются при загрузке, а не при первом показе страницы
+    schedule_thumbnails(instance)
+
+
+def schedule_spec_sheet_refresh(category_ids=(), attribute_ids=()):
+    """Пересборка характеристик затронутых ветвей после фиксации - одна на транзакцию"""
+    category_ids = {category_id for category_id in category_ids if category_id}
+    attribute_ids = set(attribute_ids)
+    connection = transaction.get_connection()
+    pending = getattr(connection, PENDING_SPEC_SHEETS, None)
+    if pending is not None and _is_scheduled(connection, pending['flush']):
+        pending['category_ids'].update(category_ids)
+        pending['attribute_ids'].update(attribute_ids)
+        return
+
+    def flush():
+        setattr(connection, PENDING_SPEC_SHEETS, None)
+        refresh_branch_spec_sheets(category_ids, attribute_ids)
+
+    setattr(connection, PENDING_SPEC_SHEETS, {
+        'category_ids': category_ids, 'attribute_ids': attribute_ids, 'flush': flush
+    })
+    transaction.on_commit(flush)
+
+
+@receiver([post_save, post_delete], sender=AttributeGroup)
+def update_group_spec_sheets(sender, instance, **kwargs):
+    schedule_spec_sheet_refresh(category_ids=[instance.category_id])
+
+
+@receiver([post_save, post_delete], sender=AttributeGroupLink)
+def update_group_link_spec_sheets(sender, instance, **kwargs):
+    schedule_spec_sheet_refresh(
+        category_ids=AttributeGroup.objects.filter(pk=instance.group_id).values_list('category_id', flat=True)
+    )
+
+
+@receiver(m2m_changed, sender=Attribute.groups.through)
+def update_attribute_groups_spec_sheets(sender, instance, action, reverse, pk_set, **kwargs):
+    # Перед очисткой связи еще видны, после - нет
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if reverse:
+        groups = AttributeGroup.objects.filter(pk=instance.pk)
+    elif action == 'pre_clear':
+        groups = instance.groups.all()
+    else:
+        groups = AttributeGroup.objects.filter(pk__in=pk_set)
+    schedule_spec_sheet_refresh(category_ids=groups.values_list('category_id', flat=True))
+
+
+@receiver(post_save, sender=Attribute)
+def update_attribute_spec_sheets(sender, instance, created=False, **kwargs):
+    # Название, единица и тип видны в характеристиках товаров со значениями атрибута
+    if not created:
+        schedule_spec_sheet_refresh(attribute_ids=[instance.pk])
+
+
+@receiver(post_save, sender=Category)
+def update_moved_category_spec_sheets(sender, instance, created=False, **kwargs):
+    # Дерево в кэше еще прежнее: перенос меняет группы ветвей старого и нового родителя
+    node = get_category_tree().get(instance.pk)
+    if created or node is None or node['parent_id'] == instance.parent_id:
+        return
+    schedule_spec_sheet_refresh(category_ids=[node['parent_id'], instance.pk])
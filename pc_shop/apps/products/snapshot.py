@@ -0,0 +1,232 @@
+import time
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.utils.functional import cached_property
+from django_filters.constants import EMPTY_VALUES
+
+from apps.catalog_config.schema import SCHEMA_NAMESPACE, get_category_schema
+from apps.catalog_config.tree import CATEGORY_TREE_NAMESPACE, get_category_tree
+from apps.core.cache import get_version
+from apps.products.counts import COUNT_IGNORED_PARAMS, ResultCount
+from apps.products.facets import PRICE_PARAMS, PRICE_RANGES, build_facets
+from apps.products.invalidation import category_namespace
+from apps.products.models import Product, ProductAttributeValue
+
+try:
+    import numpy as np
+except ImportError:  # Снимок необязателен: без NumPy каталог работает через SQL
+    np = None
+
+# Изменения в обход сигналов (F-обновления остатков, bulk-операции) видны не позже чем через
+SNAPSHOT_MAX_AGE = 60 * 5
+SNAPSHOT_DATA_TYPES = ('number', 'enum', 'boolean')
+# Столбцы снимка, по которым возможна сортировка (см. pagination.SORT_ORDERINGS)
+SNAPSHOT_SORT_COLUMNS = ('id', 'price', 'created_at', 'rating_avg')
+
+# Снимки процесса: {category_id: (версии, время постройки, снимок)}
+_snapshots = {}
+
+
+class CategorySnapshot:
+    """Столбцовый снимок товаров категории (с подкатегориями) в массивах NumPy.
+
+    Строки упорядочены по id. Числовые атрибуты - массивы с NaN для отсутствующих значений,
+    варианты списков и логические атрибуты - булевы маски по каждому значению.
+    """
+
+    def __init__(self, schema, columns, numeric, options, booleans):
+        self.schema = schema
+        self.columns = columns
+        self.numeric = numeric
+        self.options = options
+        self.booleans = booleans
+        self.size = len(columns['id'])
+        self.data_types = {
+            attr['id']: attr['data_type'] for attr in schema.attributes
+            if attr['data_type'] in SNAPSHOT_DATA_TYPES
+        }
+
+    @cached_property
+    def supported_params(self):
+        params = set(COUNT_IGNORED_PARAMS) | set(PRICE_PARAMS) | {'is_digital'}
+        for attribute_id, data_type in self.data_types.items():
+            if data_type == 'number':
+                params |= {f'attr_{attribute_id}_min', f'attr_{attribute_id}_max'}
+            else:
+                params.add(f'attr_{attribute_id}')
+        return params
+
+    def supports(self, params):
+        """Запрос вычислим по снимку: нет поиска, строковых атрибутов и прочих фильтров"""
+        return all(
+            key in self.supported_params
+            for key in params if any(value != '' for value in params.getlist(key))
+        )
+
+    def _masks(self, values):
+        """Маски по каждому активному фильтру: {имя фильтра: булев массив}"""
+        masks = {}
+        price = values.get('price')
+        if price not in EMPTY_VALUES:
+            masks['price'] = self._range_mask(self.columns['price'], price)
+        if values.get('is_digital') is not None:
+            masks['is_digital'] = self.columns['is_digital'] == values['is_digital']
+
+        for attribute_id, data_type in self.data_types.items():
+            name = f'attr_{attribute_id}'
+            value = values.get(name)
+            if value in EMPTY_VALUES:
+                continue
+            if data_type == 'number':
+                masks[name] = self._range_mask(self.numeric[attribute_id], value)
+            elif data_type == 'enum':
+                mask = np.zeros(self.size, dtype=bool)
+                for option_id in value:
+                    option_mask = self.options[attribute_id].get(int(option_id))
+                    if option_mask is not None:
+                        mask |= option_mask
+                masks[name] = mask
+            else:
+                masks[name] = self.booleans[attribute_id][bool(value)]
+        return masks
+
+    def _range_mask(self, column, value):
+        # Как lookups gte/lte: NaN (нет значения) не проходит ни одну границу
+        mask = ~np.isnan(column)
+        if value.start is not None:
+            mask &= column >= float(value.start)
+        if value.stop is not None:
+            mask &= column <= float(value.stop)
+        return mask
+
+    def _combine(self, masks, exclude=None):
+        mask = np.ones(self.size, dtype=bool)
+        for name, filter_mask in masks.items():
+            if name != exclude:
+                mask &= filter_mask
+        return mask
+
+    def select(self, values, ordering):
+        """id товаров, прошедших фильтры, в порядке сортировки"""
+        indexes = np.flatnonzero(self._combine(self._masks(values)))
+        # lexsort: последний ключ - главный; убывание - через смену знака
+        keys = []
+        for field in reversed(ordering):
+            column = self.columns[field.lstrip('-')][indexes]
+            keys.append(-column if field.startswith('-') else column)
+        return self.columns['id'][indexes[np.lexsort(keys)]].tolist()
+
+    def supports_ordering(self, ordering):
+        return all(field.lstrip('-') in SNAPSHOT_SORT_COLUMNS for field in ordering)
+
+    def facets(self, values, data):
+        """Фасеты со счетчиками: каждая маска фасета без его собственного выбора"""
+        masks = self._masks(values)
+        counts = {}
+        for attribute_id, data_type in self.data_types.items():
+            if data_type == 'number':
+                continue
+            mask = self._combine(masks, exclude=f'attr_{attribute_id}')
+            by_value = self.options[attribute_id] if data_type == 'enum' else self.booleans[attribute_id]
+            counts[attribute_id] = {
+                value: int(np.count_nonzero(mask & value_mask)) for value, value_mask in by_value.items()
+            }
+
+        price_mask = self._combine(masks, exclude='price')
+        prices = self.columns['price'][price_mask]
+        price_counts = [
+            int(np.count_nonzero((prices >= low) & (prices < high if high is not None else True)))
+            for low, high in PRICE_RANGES
+        ]
+
+        bounds = {}
+        for attribute_id, data_type in self.data_types.items():
+            column = self.numeric.get(attribute_id)
+            if data_type == 'number' and column is not None and not np.isnan(column).all():
+                bounds[attribute_id] = (float(np.nanmin(column)), float(np.nanmax(column)))
+
+        return build_facets(self.schema, data, counts, price_counts, bounds)
+
+
+def build_snapshot(category_id):
+    """Снимок двумя запросами: товары категории и их типизированные значения атрибутов"""
+    schema = get_category_schema(category_id)
+    category_ids = get_category_tree().descendant_ids(category_id)
+
+    rows = list(Product.objects.filter(category_id__in=category_ids).order_by('id').values_list(
+        'id', 'price', 'is_digital', 'created_at', 'rating_avg'
+    ))
+    size = len(rows)
+    columns = {
+        'id': np.fromiter((row[0] for row in rows), dtype=np.int64, count=size),
+        'price': np.fromiter((float(row[1]) for row in rows), dtype=np.float64, count=size),
+        'is_digital': np.fromiter((row[2] for row in rows), dtype=bool, count=size),
+        'created_at': np.fromiter((row[3].timestamp() for row in rows), dtype=np.float64, count=size),
+        'rating_avg': np.fromiter((row[4] for row in rows), dtype=np.float64, count=size),
+    }
+
+    data_types = {
+        attr['id']: attr['data_type'] for attr in schema.attributes
+        if attr['data_type'] in SNAPSHOT_DATA_TYPES
+    }
+    numeric = {pk: np.full(size, np.nan) for pk, data_type in data_types.items() if data_type == 'number'}
+    options = {
+        attr['id']: {option_id: np.zeros(size, dtype=bool) for option_id, _ in attr['options']}
+        for attr in schema.attributes if attr['data_type'] == 'enum'
+    }
+    booleans = {
+        pk: {True: np.zeros(size, dtype=bool), False: np.zeros(size, dtype=bool)}
+        for pk, data_type in data_types.items() if data_type == 'boolean'
+    }
+
+    values = ProductAttributeValue.objects.filter(
+        product__category_id__in=category_ids,
+        attribute_id__in=list(data_types)
+    ).values_list('product_id', 'attribute_id', 'value_number', 'value_option_id', 'value_boolean')
+    for product_id, attribute_id, number, option_id, boolean in values.iterator(chunk_size=5000):
+        index = np.searchsorted(columns['id'], product_id)
+        data_type = data_types[attribute_id]
+        if data_type == 'number' and number is not None:
+            numeric[attribute_id][index] = number
+        elif data_type == 'enum' and option_id in options[attribute_id]:
+            options[attribute_id][option_id][index] = True
+        elif data_type == 'boolean' and boolean is not None:
+            booleans[attribute_id][boolean][index] = True
+
+    return CategorySnapshot(schema, columns, numeric, options, booleans)
+
+
+def is_snapshot_enabled(category):
+    return np is not None and category.slug in getattr(settings, 'CATALOG_SNAPSHOT_CATEGORIES', ())
+
+
+def get_category_snapshot(category_id):
+    """Снимок из памяти процесса; перестраивается при смене версии товаров категории,
+    дерева (перенос товаров между категориями) или схемы"""
+    versions = tuple(get_version(namespace) for namespace in (
+        category_namespace(category_id), CATEGORY_TREE_NAMESPACE, SCHEMA_NAMESPACE
+    ))
+    cached = _snapshots.get(category_id)
+    if cached and cached[0] == versions and time.monotonic() - cached[1] < SNAPSHOT_MAX_AGE:
+        return cached[2]
+
+    snapshot = build_snapshot(category_id)
+    _snapshots[category_id] = (versions, time.monotonic(), snapshot)
+    return snapshot
+
+
+class SnapshotPaginator(Paginator):
+    """Постраничный вывод списка id из снимка: одна выборка товаров на страницу"""
+
+    def __init__(self, ids, per_page, queryset, **kwargs):
+        super().__init__(ids, per_page, **kwargs)
+        self.queryset = queryset
+
+    @cached_property
+    def result_count(self):
+        return ResultCount(len(self.object_list))
+
+    def _get_page(self, ids, number, paginator):
+        products = self.queryset.filter(pk__in=ids).in_bulk()
+        return super()._get_page([products[pk] for pk in ids if pk in products], number, paginator)
@@ -0,0 +1,106 @@
+from django.db.models import Q
+
+from apps.catalog_config.models import Attribute
+from apps.catalog_config.schema import get_branch_groups
+from apps.catalog_config.tree import get_category_tree
+from apps.core.cache import bump_version
+from apps.products.models import Product, ProductAttributeValue
+
+SPEC_SHEET_NAMESPACE = 'spec_sheet'
+SPEC_SHEET_BATCH_SIZE = 500
+
+# Атрибуты без группы в схеме категории
+OTHER_GROUP_NAME = 'Прочее'
+BOOLEAN_LABELS = {True: 'Да', False: 'Нет'}
+
+
+def format_spec_value(attribute, value):
+    """Значение характеристики для отображения, с единицей измерения"""
+    if attribute['data_type'] == 'boolean':
+        return BOOLEAN_LABELS.get(value, str(value))
+    if isinstance(value, list):
+        value = ', '.join(map(str, value))
+    elif isinstance(value, float) and value.is_integer():
+        value = int(value)
+    if attribute['unit'] and attribute['data_type'] == 'number':
+        return f'{value} {attribute["unit"]}'
+    return str(value)
+
+
+def build_spec_sheet(product):
+    """Характеристики товара: [{'name': группа, 'attributes': [{'name', 'value'}]}]
+    в порядке групп и атрибутов схемы категории"""
+    values = dict(ProductAttributeValue.objects.filter(product=product).values_list('attribute_id', 'value'))
+
+    sheet, placed = [], set()
+    for group in get_branch_groups(product.category_id):
+        rows = [
+            {'name': attribute['name'], 'value': format_spec_value(attribute, values[attribute['id']])}
+            for attribute in group['attributes'] if attribute['id'] in values
+        ]
+        placed.update(attribute['id'] for attribute in group['attributes'])
+        if rows:
+            sheet.append({'name': group['name'], 'attributes': rows})
+
+    missing = Attribute.objects.filter(pk__in=set(values) - placed).order_by('tree_id', 'lft').values(
+        'id', 'name', 'data_type', 'unit'
+    ) if set(values) - placed else []
+    rows = [{'name': attribute['name'], 'value': format_spec_value(attribute, values[attribute['id']])}
+            for attribute in missing]
+    if rows:
+        sheet.append({'name': OTHER_GROUP_NAME, 'attributes': rows})
+    return sheet
+
+
+def get_spec_sheet(product):
+    """Сохраненные характеристики, только чтение: пересобираются при изменении значений
+    и схем категорий (apps.products.signals) и командой rebuild_spec_sheets"""
+    if product.spec_sheet is None:
+        # Товар еще не обработан - без записи из GET-запроса
+        return build_spec_sheet(product)
+    return product.spec_sheet
+
+
+def spec_sheet_namespace(category_id, tree=None):
+    """Версия характеристик ветви - корневой категории: схема товара собирается
+    из групп его предков и потомков (get_branch_groups)"""
+    tree = tree or get_category_tree()
+    ancestors = tree.ancestor_ids(category_id, include_self=True)
+    return f'{SPEC_SHEET_NAMESPACE}:{ancestors[-1] if ancestors else category_id}'
+
+
+def refresh_spec_sheets(product_ids=None):
+    """Пересборка характеристик товаров (всех, если product_ids не задан) пачками"""
+    products = Product.objects.only('pk', 'category_id')
+    if product_ids is not None:
+        products = products.filter(pk__in=product_ids)
+
+    total, updated = 0, []
+    for product in products.iterator(chunk_size=SPEC_SHEET_BATCH_SIZE):
+        product.spec_sheet = build_spec_sheet(product)
+        updated.append(product)
+        if len(updated) == SPEC_SHEET_BATCH_SIZE:
+            Product.objects.bulk_update(updated, ['spec_sheet'])
+            total += len(updated)
+            updated = []
+    Product.objects.bulk_update(updated, ['spec_sheet'])
+    return total + len(updated)
+
+
+def refresh_branch_spec_sheets(category_ids=(), attribute_ids=()):
+    """Пересборка после изменения схем: товары ветвей категорий (предки, сама категория
+    и потомки) и товары со значениями измененных атрибутов; затем новые версии ветвей"""
+    tree = get_category_tree()
+    branch = set()
+    for category_id in category_ids:
+        branch.update(tree.descendant_ids(category_id))
+        branch.update(tree.ancestor_ids(category_id))
+    products = Product.objects.filter(
+        Q(category_id__in=branch)
+        | Q(pk__in=ProductAttributeValue.objects.filter(attribute_id__in=attribute_ids).values('product_id'))
+    )
+    total = refresh_spec_sheets(products.values('pk'))
+    categories = branch | set(products.values_list('category_id', flat=True).distinct())
+    for namespace in {spec_sheet_namespace(category_id, tree) for category_id in categories}:
+        bump_version(namespace)
+    return total
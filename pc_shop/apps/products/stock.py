@@ -0,0 +1,187 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import BooleanField, Case, ExpressionWrapper, F, Q, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from apps.products.cards import invalidate_product_cards
+from apps.products.invalidation import invalidate_catalog
+from apps.products.models import Product, StockReservation
+
+# Срок резерва позиции корзины, продлевается при каждом изменении позиции
+RESERVATION_TTL = timedelta(hours=1)
+EXPIRE_BATCH_SIZE = 1000
+
+
+class InsufficientStock(ValidationError):
+    """Остатка не хватило: в available - сколько было доступно в момент отказа"""
+
+    def __init__(self, product, quantity, available):
+        self.available = available
+        super().__init__(f"Недостаточно товара «{product.name}»: доступно {available} шт., запрошено {quantity}")
+
+
+def _check_quantity(quantity):
+    if quantity < 1:
+        raise ValidationError("Количество должно быть положительным")
+
+
+def _available_after(reserved):
+    # Выражения SET видят значения строки до обновления
+    return ExpressionWrapper(Q(quantity__gt=reserved), output_field=BooleanField())
+
+
+def _stock_changed(product_ids, category_ids=()):
+    """UPDATE минует сигналы Product: карточка и страница товара показывают остаток.
+
+    Версии каталога (списки, счетчики, фасеты, снимки) меняются, только если товар
+    перешел между "в наличии" и "нет в наличии" - категории передаются лишь тогда.
+    """
+    invalidate_product_cards(product_ids)
+    if category_ids:
+        invalidate_catalog(category_ids)
+
+
+def _available_quantity(product):
+    stock = Product.objects.filter(pk=product.pk).values_list('quantity', 'reserved_quantity').first()
+    return max(stock[0] - stock[1], 0) if stock else 0
+
+
+def reserve_quantity(product, quantity):
+    """Резерв одним UPDATE ... SET reserved_quantity = reserved_quantity + n
+    WHERE quantity - reserved_quantity >= n.
+
+    Строка товара не блокируется заранее: проверка и резерв происходят в одном
+    условном UPDATE, ноль затронутых строк означает нехватку остатка.
+    product.reserved_quantity обновляется по месту и может отставать от параллельных операций.
+    """
+    _check_quantity(quantity)
+    reserved = F('reserved_quantity') + quantity
+    products = Product.objects.filter(pk=product.pk)
+    # Обычно остаток после резерва еще есть и наличие не меняется;
+    # иначе - резерв последних единиц, товар уходит из наличия
+    if products.filter(quantity__gt=reserved).update(reserved_quantity=reserved):
+        sold_out = False
+    elif products.filter(quantity=reserved).update(reserved_quantity=reserved, is_available=False):
+        sold_out = True
+    else:
+        raise InsufficientStock(product, quantity, _available_quantity(product))
+    product.reserved_quantity += quantity
+    product.is_available = product.available_quantity > 0
+    _stock_changed([product.pk], [product.category_id] if sold_out else ())
+
+
+def release_quantity(product, quantity):
+    """Возврат резерва одним UPDATE"""
+    _check_quantity(quantity)
+    reserved = Greatest(F('reserved_quantity') - quantity, 0)
+    products = Product.objects.filter(pk=product.pk)
+    # Товар был полностью зарезервирован и снова появляется в наличии
+    restocked = products.filter(quantity__lte=F('reserved_quantity'), quantity__gt=reserved).update(
+        reserved_quantity=reserved, is_available=True
+    )
+    if not restocked:
+        products.update(reserved_quantity=reserved, is_available=_available_after(reserved))
+    product.reserved_quantity = max(product.reserved_quantity - quantity, 0)
+    product.is_available = product.available_quantity > 0
+    _stock_changed([product.pk], [product.category_id] if restocked else ())
+
+
+def adjust_reservation(product, delta):
+    """Изменение резерва на delta: положительное резервирует, отрицательное возвращает"""
+    if delta > 0:
+        reserve_quantity(product, delta)
+    elif delta < 0:
+        release_quantity(product, -delta)
+
+
+def reserve_item(item):
+    """Резерв позиции корзины на item.quantity со сроком RESERVATION_TTL.
+
+    Блокируется только строка резерва позиции; разница с прежним резервом
+    (или весь объем, если резерв уже снят по сроку) списывается условным UPDATE.
+    """
+    with transaction.atomic():
+        reservation = StockReservation.objects.select_for_update().filter(cart_item=item).first()
+        adjust_reservation(item.product, item.quantity - (reservation.quantity if reservation else 0))
+        expires_at = timezone.now() + RESERVATION_TTL
+        if reservation is None:
+            StockReservation.objects.create(
+                product=item.product, cart_item=item, quantity=item.quantity, expires_at=expires_at
+            )
+        else:
+            reservation.quantity = item.quantity
+            reservation.expires_at = expires_at
+            reservation.save(update_fields=['quantity', 'expires_at'])
+
+
+def _release_rows(rows):
+    """Удаление строк резерва (id, product_id, quantity) и возврат их суммы одним UPDATE товаров"""
+    totals = defaultdict(int)
+    for _, product_id, quantity in rows:
+        totals[product_id] += quantity
+    StockReservation.objects.filter(pk__in=[pk for pk, _, _ in rows]).delete()
+
+    released = Case(*(When(pk=pk, then=Value(total)) for pk, total in totals.items()), default=Value(0))
+    reserved = Greatest(F('reserved_quantity') - released, 0)
+    products = Product.objects.filter(pk__in=totals)
+    # Категории товаров, которые снова появятся в наличии, - до обновления
+    restocked = set(
+        products.filter(quantity__lte=F('reserved_quantity'), quantity__gt=reserved).values_list(
+            'category_id', flat=True
+        )
+    )
+    products.update(reserved_quantity=reserved, is_available=_available_after(reserved))
+    _stock_changed(totals, restocked)
+
+
+def release_reservations(reservations):
+    """Снятие резервов выборки StockReservation (позиции, корзины)"""
+    with transaction.atomic():
+        rows = list(reservations.select_for_update().values_list('id', 'product_id', 'quantity'))
+        if rows:
+            _release_rows(rows)
+    return len(rows)
+
+
+def release_item(item):
+    release_reservations(StockReservation.objects.filter(cart_item=item))
+
+
+def fulfil_item(item):
+    """Оформление заказа: резерв позиции становится списанием со склада"""
+    with transaction.atomic():
+        # Резерв мог истечь или не совпадать с позицией - сначала приводим его к item.quantity
+        reserve_item(item)
+        StockReservation.objects.filter(cart_item=item).delete()
+        Product.objects.filter(pk=item.product_id).update(
+            quantity=F('quantity') - item.quantity,
+            reserved_quantity=F('reserved_quantity') - item.quantity,
+        )
+        item.product.quantity -= item.quantity
+        item.product.reserved_quantity -= item.quantity
+
+
+def expire_reservations(now=None, batch_size=EXPIRE_BATCH_SIZE):
+    """Снятие истекших резервов проходом по индексу expires_at пачками.
+
+    Строки, которые в этот момент меняют корзины, пропускаются (SKIP LOCKED)
+    и снимаются следующим проходом, если их срок не продлили.
+    """
+    now = now or timezone.now()
+    total = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                StockReservation.objects.filter(expires_at__lte=now).select_for_update(
+                    skip_locked=True
+                ).values_list('id', 'product_id', 'quantity')[:batch_size]
+            )
+            if rows:
+                _release_rows(rows)
+        total += len(rows)
+        if len(rows) < batch_size:
+            return total
@@ -0,0 +1,27 @@
+from celery import shared_task
+from django.db import transaction
+
+from apps.products.models import ProductImage
+from apps.products.thumbnails import generate_image_thumbnails
+
+
+@shared_task
+def generate_product_image_thumbnails(image_id):
+    """Миниатюры и адаптивные варианты загруженного изображения в фоновом воркере"""
+    image = ProductImage.objects.filter(pk=image_id).first()
+    if image is None or not image.image:
+        return
+    # Пока задача ждала очереди, миниатюры могли создать командой generate_thumbnails
+    if image.thumbnails.get('source') == image.image.name and 'variants' in image.thumbnails:
+        return
+    generate_image_thumbnails(image)
+
+
+def schedule_thumbnails(image):
+    """Постановка в очередь после фиксации: запрос на загрузку не ждет рендера.
+
+    robust: недоступный брокер или ошибка рендера не ломают уже сохраненную загрузку,
+    миниатюры тогда досоздаст generate_thumbnails.
+    """
+    if image.image and image.thumbnails.get('source') != image.image.name:
+        transaction.on_commit(lambda: generate_product_image_thumbnails.delay(image.pk), robust=True)
@@ -1,8 +1,8 @@
 from django import template
-from apps.products.models import ProductImage
 
 register = template.Library()
 
 @register.filter
 def get_main_image(gallery):
-    return gallery.filter(is_main=True).first()
\ No newline at end of file
+    # Через товар, чтобы использовать предзагруженное изображение
+    return gallery.instance.main_image()
@@ -1,7 +1,43 @@
+import json
+
 from django import template
 
+from apps.products.cards import render_product_cards
+from apps.products.models import RESPONSIVE_VARIANTS
+
 register = template.Library()
 
 @register.filter
 def get_range(value):
-    return range(value)
\ No newline at end of file
+    return range(value)
+
+
+@register.simple_tag
+def product_cards(products):
+    """Карточки товаров страницы из кэша фрагментов (apps.products.cards)"""
+    return render_product_cards(products)
+
+
+@register.inclusion_tag('products/includes/responsive_image.html')
+def responsive_image(image, variant='card', sizes=None, alt='', css_class='', element_id='', lazy=True):
+    """<picture> с AVIF/WebP srcset готовых вариантов и JPEG-миниатюрой в <img>"""
+    config = RESPONSIVE_VARIANTS[variant]
+    fallback = image.get_thumbnail(config['fallback']) if image.image else None
+    return {
+        'sources': image.get_sources(variant),
+        'sizes': sizes or config['sizes'],
+        'src': image.get_thumbnail_url(config['fallback']),
+        'width': fallback['width'] if fallback else None,
+        'height': fallback['height'] if fallback else None,
+        'alt': alt,
+        'css_class': css_class,
+        'element_id': element_id,
+        'lazy': lazy,
+    }
+
+
+@register.simple_tag
+def image_sources(image, variant='gallery'):
+    """JSON со списком <source> для смены изображения в галерее на стороне клиента"""
+    sizes = RESPONSIVE_VARIANTS[variant]['sizes']
+    return json.dumps([{**source, 'sizes': sizes} for source in image.get_sources(variant)])
@@ -1,14 +1,18 @@
 from django import template
-from urllib.parse import urlencode
+
+from apps.core.querystring import canonical_query
 
 register = template.Library()
 
 @register.simple_tag(takes_context=True)
 def url_replace(context, **kwargs):
     query = context['request'].GET.copy()
+    # Удаляем пагинацию при изменении параметров (если она не задается явно)
+    for key in ('page', 'cursor'):
+        if key in query and key not in kwargs:
+            del query[key]
     for key, value in kwargs.items():
-        query[key] = value
-    # Удаляем пагинацию при изменении параметров
-    if 'page' in query:
-        del query['page']
-    return query.urlencode()
\ No newline at end of file
+        query[key] = str(value)
+    # Ссылка сразу в каноническом виде - без редиректа и с попаданием в кэш страниц
+    defaults = getattr(context.get('view'), 'canonical_defaults', None)
+    return canonical_query(query, defaults)
@@ -1,3 +1,403 @@
+import io
+import json
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock, skipIf
+
+from django.core.cache import cache
+from django.http import QueryDict
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.cart.models import Cart, CartItem
+from apps.catalog_config.models import Attribute, AttributeGroup, AttributeGroupLink, Category, EnumOption
+from apps.products.facets import compute_facets
+from apps.products.export import export_attribute_names, export_csv, export_jsonl, iter_products
+from apps.products.filters import ProductFilter
+from apps.products.importer import clean_row, import_feed, read_feed
+from apps.products.models import Product, ProductAttributeValue, StockReservation
+from apps.products.pagination import SORT_ORDERINGS, CountingPaginator
+from apps.products.snapshot import build_snapshot, np
+from apps.products.stock import (
+    InsufficientStock, expire_reservations, fulfil_item, release_quantity, reserve_item, reserve_quantity
+)
+
+
+def create_memory_catalog():
+    """Категория с числовым, списочным и логическим атрибутами и 12 товарами в разных ценовых диапазонах"""
+    category = Category.objects.create(name='Оперативная память', slug='operativnaya-pamyat')
+    group = AttributeGroup.objects.create(name='Основные', category=category)
+    attributes = {
+        'volume': Attribute.objects.create(name='Объём', data_type='number', unit='ГБ'),
+        'type': Attribute.objects.create(name='Тип памяти', data_type='enum'),
+        'backlight': Attribute.objects.create(name='Подсветка', data_type='boolean'),
+    }
+    for attribute in attributes.values():
+        AttributeGroupLink.objects.create(attribute=attribute, group=group)
+    options = {value: EnumOption.objects.create(attribute=attributes['type'], value=value) for value in ('DDR4', 'DDR5')}
+
+    for i in range(12):
+        product = Product.objects.create(
+            sku=f'RAM-{i}', name=f'Память {i}', slug=f'ram-{i}', category=category,
+            price=Decimal(900 + i * 1000), quantity=i % 3, description='Модуль памяти'
+        )
+        ProductAttributeValue.objects.create(product=product, attribute=attributes['volume'], value=[8, 16, 32][i % 3])
+        ProductAttributeValue.objects.create(product=product, attribute=attributes['type'], value=['DDR4', 'DDR5'][i % 2])
+        if i % 4:
+            ProductAttributeValue.objects.create(product=product, attribute=attributes['backlight'], value=i % 3 == 1)
+    return category, attributes, options
+
+
+class CursorPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Оперативная память', slug='operativnaya-pamyat')
+        for i in range(30):
+            Product.objects.create(
+                sku=f'RAM-{i}', name=f'Память {i}', slug=f'ram-{i}', category=cls.category,
+                price=Decimal(1000 + i * 100), quantity=1
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_second_page_by_cursor(self):
+        url = reverse('product_list_by_category', kwargs={'category_slug': self.category.slug})
+        first = self.client.get(url, {'cursor': ''})
+        self.assertEqual(first.status_code, 200)
+        page = first.context['page_obj']
+        self.assertEqual(len(page), 24)
+        self.assertTrue(page.has_next())
+
+        second = self.client.get(url, {'cursor': page.next_cursor})
+        self.assertEqual(second.status_code, 200)
+        second_page = second.context['page_obj']
+        self.assertEqual(
+            [product.sku for product in second_page],
+            [f'RAM-{i}' for i in range(24, 30)]
+        )
+        self.assertFalse(second_page.has_next())
+
+
+class CountingPaginatorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Процессоры', slug='protsessory')
+        for i in range(30):
+            Product.objects.create(
+                sku=f'CPU-{i}', name=f'Процессор {i}', slug=f'cpu-{i}', category=category,
+                price=Decimal(10000 + i), quantity=1
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    @mock.patch('apps.products.counts.estimate_count', return_value=5000)
+    def test_pages_and_result_count_are_exact(self, estimate_count):
+        paginator = CountingPaginator(Product.objects.order_by('id'), 24)
+        self.assertEqual(paginator.count, 30)
+        self.assertEqual(paginator.num_pages, 2)
+        self.assertEqual(str(paginator.result_count), '30')
+        estimate_count.assert_not_called()
+
+    @mock.patch('apps.products.counts.estimate_count', return_value=5000)
+    def test_cursor_mode_shows_estimate(self, estimate_count):
+        url = reverse('product_list_by_category', kwargs={'category_slug': 'protsessory'})
+        response = self.client.get(url, {'cursor': ''})
+        self.assertEqual(str(response.context['result_count']), '5000+')
+
+    @mock.patch('apps.products.counts.estimate_count', return_value=5000)
+    def test_page_mode_shows_exact_count(self, estimate_count):
+        url = reverse('product_list_by_category', kwargs={'category_slug': 'protsessory'})
+        response = self.client.get(url)
+        self.assertEqual(str(response.context['result_count']), '30')
+        estimate_count.assert_not_called()
+
+
+class StockReservationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Видеокарты', slug='videokarty')
+
+    def setUp(self):
+        self.product = Product.objects.create(
+            sku='GPU-1', name='Видеокарта', slug='gpu-1', category=self.category, price=Decimal(50000), quantity=3
+        )
+
+    def test_reserve_more_than_available(self):
+        reserve_quantity(self.product, 2)
+        with self.assertRaises(InsufficientStock) as error:
+            reserve_quantity(self.product, 2)
+        self.assertEqual(error.exception.available, 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved_quantity, 2)
+
+    def test_last_unit_flips_availability(self):
+        reserve_quantity(self.product, 2)
+        self.product.refresh_from_db()
+        self.assertTrue(self.product.is_available)
+
+        reserve_quantity(self.product, 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved_quantity, 3)
+        self.assertFalse(self.product.is_available)
+
+        release_quantity(self.product, 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved_quantity, 2)
+        self.assertTrue(self.product.is_available)
+
+    @mock.patch('apps.products.stock.invalidate_catalog')
+    def test_catalog_invalidated_only_on_flip(self, invalidate_catalog):
+        reserve_quantity(self.product, 1)
+        release_quantity(self.product, 1)
+        invalidate_catalog.assert_not_called()
+
+        reserve_quantity(self.product, 3)
+        invalidate_catalog.assert_called_once_with([self.category.id])
+
+
+class CartReservationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Накопители', slug='nakopiteli')
+
+    def setUp(self):
+        self.product = Product.objects.create(
+            sku='SSD-1', name='Накопитель', slug='ssd-1', category=self.category, price=Decimal(8000), quantity=2
+        )
+        self.item = CartItem.objects.create(
+            cart=Cart.objects.create(session_key='test'), product=self.product, quantity=2
+        )
+
+    def expire(self):
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+
+    def test_reserve_item_renews_reservation(self):
+        reserve_item(self.item)
+        self.expire()
+        self.item.quantity = 1
+        reserve_item(self.item)
+
+        reservation = StockReservation.objects.get(cart_item=self.item)
+        self.assertEqual(reservation.quantity, 1)
+        self.assertGreater(reservation.expires_at, timezone.now())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved_quantity, 1)
+
+    def test_expiry_returns_reserved_quantity(self):
+        reserve_item(self.item)
+        self.product.refresh_from_db()
+        self.assertFalse(self.product.is_available)
+
+        self.expire()
+        self.assertEqual(expire_reservations(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved_quantity, 0)
+        self.assertTrue(self.product.is_available)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_fulfil_item_after_expiry(self):
+        reserve_item(self.item)
+        self.expire()
+        expire_reservations()
+
+        fulfil_item(self.item)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 0)
+        self.assertEqual(self.product.reserved_quantity, 0)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_save_keeps_concurrent_reservation(self):
+        stale = Product.objects.get(pk=self.product.pk)
+        reserve_item(self.item)
+
+        stale.price = Decimal(7500)
+        stale.save()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.price, Decimal(7500))
+        self.assertEqual(self.product.reserved_quantity, 2)
+        self.assertFalse(self.product.is_available)
+
+        stale.quantity = 5
+        stale.save()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved_quantity, 2)
+        self.assertTrue(self.product.is_available)
+
+
+class CatalogImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category, cls.attributes, _ = create_memory_catalog()
+
+    def setUp(self):
+        cache.clear()
+
+    def import_jsonl(self, *rows):
+        stream = io.StringIO(''.join(json.dumps(row, ensure_ascii=False) + '\n' for row in rows))
+        return import_feed(read_feed(stream, 'jsonl'))
+
+    def row(self, sku, **fields):
+        return {'sku': sku, 'name': f'Память {sku}', 'category': self.category.slug, 'price': '1000', **fields}
+
+    def test_non_object_attributes_reported(self):
+        report = self.import_jsonl(
+            self.row('NEW-1', attributes=['DDR4']),
+            self.row('NEW-2', attributes=None),
+            self.row('NEW-3', attributes={'Тип памяти': 'DDR4', 'Объём': '16'}),
+        )
+        self.assertEqual(report.created, 1)
+        self.assertEqual([(line, sku) for line, sku, _ in report.errors], [(1, 'NEW-1'), (2, 'NEW-2')])
+        values = dict(ProductAttributeValue.objects.filter(product__sku='NEW-3').values_list('attribute_id', 'value'))
+        self.assertEqual(values, {self.attributes['type'].id: 'DDR4', self.attributes['volume'].id: 16})
+
+    def test_invalid_attribute_value_reported(self):
+        report = self.import_jsonl(self.row('NEW-1', attributes={'Тип памяти': 'DDR3'}))
+        self.assertEqual(report.created, 0)
+        self.assertIn('недопустимое значение', report.errors[0][2])
+
+    def test_generated_slugs_do_not_collide(self):
+        Product.objects.create(sku='OLD-1', name='Старая память', slug='zhd-001', category=self.category, price=1)
+        report = self.import_jsonl(
+            self.row('ЖД-001'), self.row('КБ-001'), self.row('ЖД 001'), self.row('NEW-1', slug='ram-1')
+        )
+        self.assertEqual(report.created, 3)
+        self.assertEqual(report.errors[0][1], 'NEW-1')
+        self.assertEqual(
+            dict(Product.objects.filter(sku__in=['ЖД-001', 'КБ-001', 'ЖД 001']).values_list('sku', 'slug')),
+            {'ЖД-001': 'zhd-001-2', 'КБ-001': 'kb-001', 'ЖД 001': 'zhd-001-3'}
+        )
+
+    def test_undecodable_feed_reported(self):
+        data = f'sku,name,category,price\nЖД-1,Память,{self.category.slug},100\n'.encode('cp1251')
+        report = import_feed(read_feed(io.TextIOWrapper(io.BytesIO(data), encoding='utf-8-sig', newline=''), 'csv'))
+        self.assertEqual(report.created, 0)
+        self.assertEqual(len(report.errors), 1)
+
+        stream = io.TextIOWrapper(io.BytesIO(data), encoding='cp1251', newline='')
+        self.assertEqual(import_feed(read_feed(stream, 'csv')).created, 1)
+
+
+class CatalogExportRoundTripTests(TestCase):
+    """Выгрузка CSV и JSONL читается импортом обратно в те же поля и значения"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category, _, _ = create_memory_catalog()
+        Product.objects.filter(sku='RAM-0').update(is_digital=True, description='Модуль "A", 2 шт.\nс радиатором')
+
+    def setUp(self):
+        cache.clear()
+
+    def expected(self):
+        products = {
+            product.sku: product for product in Product.objects.filter(category=self.category)
+        }
+        values = {}
+        for sku, attribute_id, value in ProductAttributeValue.objects.values_list(
+                'product__sku', 'attribute_id', 'value'
+        ):
+            values.setdefault(sku, {})[attribute_id] = value
+        return {
+            sku: (
+                {
+                    'sku': sku, 'name': product.name, 'category_id': self.category.id, 'price': product.price,
+                    'quantity': product.quantity, 'is_digital': product.is_digital, 'slug': product.slug,
+                    'description': product.description,
+                },
+                values.get(sku, {})
+            )
+            for sku, product in products.items()
+        }
+
+    def assertRoundTrip(self, text, format):
+        cleaned = {}
+        for _, row in read_feed(io.StringIO(text, newline=''), format):
+            fields, values = clean_row(row)
+            cleaned[fields['sku']] = (fields, values)
+        self.assertEqual(cleaned, self.expected())
+
+    def test_csv_round_trip(self):
+        text = ''.join(export_csv(iter_products(self.category.id), export_attribute_names(self.category.id)))
+        self.assertRoundTrip(text, 'csv')
+
+    def test_jsonl_round_trip(self):
+        self.assertRoundTrip(''.join(export_jsonl(iter_products(self.category.id))), 'jsonl')
+
+
+def facet_counts(facets):
+    """{параметр: {подпись: количество}} и счетчики ценовых диапазонов"""
+    counts = {facet['param']: {option['label']: option['count'] for option in facet['options']}
+              for facet in facets['attributes']}
+    return counts, [price['count'] for price in facets['price']]
+
+
+class FacetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category, cls.attributes, cls.options = create_memory_catalog()
+
+    def setUp(self):
+        cache.clear()
+        self.type_param = f'attr_{self.attributes["type"].id}'
+        self.backlight_param = f'attr_{self.attributes["backlight"].id}'
+        self.data = QueryDict(f'{self.type_param}={self.options["DDR4"].id}&{self.backlight_param}=false')
+
+    def test_counts_exclude_own_selection(self):
+        facets = compute_facets(
+            ProductFilter.for_category(self.category.id), self.data,
+            Product.objects.filter(category=self.category), self.category.id
+        )
+        counts, price_counts = facet_counts(facets)
+        # Тип памяти - только с фильтром подсветки "Нет": RAM-2, 6 (DDR4) и RAM-3, 5, 9, 11 (DDR5)
+        self.assertEqual(counts[self.type_param], {'DDR4': 2, 'DDR5': 4})
+        # Подсветка - только с фильтром DDR4: RAM-10 "Да", RAM-2, 6 "Нет"
+        self.assertEqual(counts[self.backlight_param], {'Да': 1, 'Нет': 2})
+        # Цена - с обоими фильтрами: RAM-2 (2900) и RAM-6 (6900)
+        self.assertEqual(price_counts, [0, 1, 1, 0, 0, 0, 0])
+        selected = {
+            facet['param']: [option['label'] for option in facet['options'] if option['selected']]
+            for facet in facets['attributes']
+        }
+        self.assertEqual(selected, {self.type_param: ['DDR4'], self.backlight_param: ['Нет']})
+
+
+@skipIf(np is None, "Снимок категории требует NumPy")
+class CategorySnapshotTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category, cls.attributes, cls.options = create_memory_catalog()
+
+    def setUp(self):
+        cache.clear()
 
-# Create your tests here.
+    def test_select_matches_orm_filter(self):
+        volume, memory_type, backlight = (self.attributes[name].id for name in ('volume', 'type', 'backlight'))
+        queries = [
+            '',
+            f'attr_{memory_type}={self.options["DDR5"].id}',
+            f'attr_{memory_type}={self.options["DDR4"].id}&attr_{memory_type}={self.options["DDR5"].id}',
+            f'attr_{backlight}=true',
+            f'attr_{volume}_min=16&price_min=2000&price_max=9000',
+            f'attr_{volume}_max=8&attr_{backlight}=false',
+        ]
+        filterset_class = ProductFilter.for_category(self.category.id)
+        queryset = Product.objects.filter(category=self.category)
+        snapshot = build_snapshot(self.category.id)
+        for query in queries:
+            data = QueryDict(query)
+            filterset = filterset_class(data, queryset=queryset)
+            self.assertTrue(filterset.is_valid(), query)
+            values = filterset.form.cleaned_data
+            for ordering in SORT_ORDERINGS.values():
+                with self.subTest(query=query, ordering=ordering):
+                    self.assertEqual(
+                        snapshot.select(values, ordering),
+                        list(filterset.qs.order_by(*ordering).values_list('id', flat=True))
+                    )
+            with self.subTest(query=query, facets=True):
+                self.assertEqual(
+                    snapshot.facets(values, data), compute_facets(filterset_class, data, queryset, self.category.id)
+                )
@@ -0,0 +1,121 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.db import connections
+from django.db.models import F, Q
+from django.db.models.fields.json import KT
+from PIL import features
+from sorl.thumbnail import get_thumbnail
+
+from apps.products.cards import invalidate_product_cards
+from apps.products.invalidation import invalidate_catalog
+from apps.products.models import (
+    RESPONSIVE_FORMATS, RESPONSIVE_VARIANTS, THUMBNAIL_OPTIONS, Product, ProductImage
+)
+
+THUMBNAIL_BATCH_SIZE = 500
+
+
+def available_formats():
+    """Форматы RESPONSIVE_FORMATS, которые умеет кодировать установленный Pillow"""
+    return [format for format in RESPONSIVE_FORMATS if features.check(format)]
+
+
+def render_variants(image_name, formats):
+    """Ширины RESPONSIVE_VARIANTS в каждом формате; без увеличения, поэтому одинаковые ширины схлопываются"""
+    variants = {}
+    for name, variant in RESPONSIVE_VARIANTS.items():
+        variants[name] = {}
+        for format in formats:
+            thumbs = {}
+            for width in variant['widths']:
+                thumb = get_thumbnail(
+                    image_name, variant['geometry'].format(width), **variant['options'], **RESPONSIVE_FORMATS[format]
+                )
+                thumbs.setdefault(thumb.width, {'url': thumb.url, 'width': thumb.width})
+            variants[name][format] = sorted(thumbs.values(), key=lambda thumb: thumb['width'])
+    return variants
+
+
+def render_thumbnails(image_name, formats=None):
+    """Все размеры THUMBNAIL_OPTIONS и адаптивные варианты для файла хранилища.
+
+    Результат: {'source', геометрия: {'url', 'width', 'height'}, 'variants': {...}}.
+    """
+    thumbnails = {'source': image_name}
+    for geometry, options in THUMBNAIL_OPTIONS.items():
+        thumb = get_thumbnail(image_name, geometry, **options)
+        thumbnails[geometry] = {'url': thumb.url, 'width': thumb.width, 'height': thumb.height}
+    thumbnails['variants'] = render_variants(image_name, available_formats() if formats is None else formats)
+    return thumbnails
+
+
+def _init_worker():
+    # При запуске через spawn процесс начинает без настроенного Django
+    django.setup()
+
+
+def _render_in_worker(item):
+    image_id, image_name = item
+    try:
+        return image_id, render_thumbnails(image_name), None
+    except Exception as e:
+        return image_id, None, str(e)
+
+
+def _store(images):
+    """Запись миниатюр и новые версии карточек: в HTML попадают URL миниатюр"""
+    ProductImage.objects.bulk_update(images, ['thumbnails'], batch_size=THUMBNAIL_BATCH_SIZE)
+    product_ids = {image.product_id for image in images}
+    invalidate_product_cards(product_ids)
+    invalidate_catalog(Product.objects.filter(pk__in=product_ids).values_list('category_id', flat=True))
+
+
+def generate_image_thumbnails(image):
+    """Миниатюры одного изображения в текущем процессе (задача apps.products.tasks)"""
+    if not image.image:
+        return
+    image.thumbnails = render_thumbnails(image.image.name)
+    _store([image])
+
+
+def stale_images():
+    """Изображения, у которых нет миниатюр или адаптивных вариантов текущего файла"""
+    return ProductImage.objects.exclude(image='').annotate(
+        source=KT('thumbnails__source')
+    ).filter(
+        Q(source__isnull=True) | ~Q(source=F('image')) | ~Q(thumbnails__has_key='variants')
+    )
+
+
+def generate_thumbnails(images, workers=None, on_error=None):
+    """Миниатюры пачки изображений в пуле процессов по числу ядер.
+
+    Рендер идет в дочерних процессах, запись результатов - пачками в текущем.
+    on_error(image_id, сообщение) вызывается для файлов, которые не удалось обработать.
+    """
+    images = {image.pk: image for image in images.only('id', 'product_id', 'image', 'thumbnails')}
+    items = [(pk, image.image.name) for pk, image in images.items()]
+    if not items:
+        return 0
+
+    # Дочерние процессы не должны унаследовать открытые соединения с базой
+    connections.close_all()
+    done, total = [], 0
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_init_worker) as pool:
+        for image_id, thumbnails, error in pool.map(_render_in_worker, items, chunksize=8):
+            if error is not None:
+                if on_error:
+                    on_error(image_id, error)
+                continue
+            image = images[image_id]
+            image.thumbnails = thumbnails
+            done.append(image)
+            total += 1
+            if len(done) >= THUMBNAIL_BATCH_SIZE:
+                _store(done)
+                done = []
+    if done:
+        _store(done)
+    return total
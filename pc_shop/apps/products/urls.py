@@ -1,7 +1,14 @@
 from django.urls import path
 from django.conf import settings
 from django.conf.urls.static import static
-from apps.products.views import ProductListView, ProductDetailView, SearchView, AddReviewView
+from apps.products.views import (
+    ProductListView,
+    ProductDetailView,
+    SearchView,
+    AddReviewView,
+    AutocompleteView,
+    CatalogFeedView,
+)
 
 urlpatterns = [
     # Каталог с поддержкой фильтров и сортировки
@@ -24,6 +31,12 @@ urlpatterns = [
     # Улучшенный поиск с фильтрацией
     path('search/', SearchView.as_view(), name='product_search'),
 
+    # Подсказки для строки поиска (JSON)
+    path('search/autocomplete/', AutocompleteView.as_view(), name='product_autocomplete'),
+
+    # Фид каталога для маркетплейсов и агрегаторов: feed.csv, feed.jsonl, feed.yml
+    path('feed.<str:format>', CatalogFeedView.as_view(), name='catalog_feed'),
+
     # Путь для добавления отзывов
     path('product/<int:product_id>/add-review/', AddReviewView.as_view(), name='add_review'),
 ]
@@ -1,61 +1,135 @@
 from django.views.generic import ListView, DetailView
-from django.db.models import Prefetch, Q, F, Count
+from django.db.models import Prefetch, Q, F
 from django.shortcuts import get_object_or_404
-from django.core.cache import cache
-from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
-from django.views.decorators.vary import vary_on_cookie
 from django.utils.translation import gettext_lazy as _
 from django_filters.views import FilterView
-from apps.products.models import Product, ProductImage, Review
+from apps.products.models import Product, ProductImage, RelatedProduct, Review
+from apps.products.export import EXPORT_EXTENSIONS, EXPORT_FORMATS, export_feed
+from apps.products.facets import get_facets
 from apps.products.filters import ProductFilter
+from apps.products.cards import card_namespace
+from apps.products.invalidation import CATALOG_NAMESPACE, catalog_namespace, reviews_namespace
+from apps.products.pagination import KeysetPaginationMixin, SORT_ORDERINGS
+from apps.products.search import AUTOCOMPLETE_LIMIT, autocomplete, search_products
+from apps.products.specs import get_spec_sheet, spec_sheet_namespace
+from apps.products.snapshot import SnapshotPaginator, get_category_snapshot, is_snapshot_enabled
 from apps.catalog_config.models import Category, Attribute
+from apps.catalog_config.schema import SCHEMA_NAMESPACE
+from apps.catalog_config.tree import CATEGORY_TREE_NAMESPACE, get_category_tree
+from apps.core.cache import get_versions
+from apps.core.conditional import ConditionalPageMixin
+from apps.core.pagecache import SharedPageCacheMixin
+from apps.core.querystring import CanonicalQueryMixin, canonical_pairs
 from django.views import View
-from django.http import JsonResponse
+from django.core.paginator import InvalidPage
+from django.conf import settings
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.utils.crypto import constant_time_compare
 from django.contrib.auth.mixins import LoginRequiredMixin
 from .models import Review
 
+# Значения по умолчанию не входят в канонический URL каталога и поиска
+CATALOG_QUERY_DEFAULTS = {'sort': 'default', 'page': '1'}
+# Похожие товары на странице товара
+RELATED_PRODUCTS_SHOWN = 4
 
-class ProductListView(FilterView):
+
+def catalog_etag_parts(view):
+    """ETag списка: путь, канонические параметры и версии пространств кэша страниц"""
+    request = view.request
+    return [
+        request.path,
+        canonical_pairs(request.GET, view.canonical_defaults),
+        get_versions(view.get_page_cache_namespaces()),
+    ]
+
+
+class ProductListView(CanonicalQueryMixin, ConditionalPageMixin, SharedPageCacheMixin, KeysetPaginationMixin, FilterView):
     model = Product
     template_name = 'products/product_list.html'
     context_object_name = 'products'
     paginate_by = 24
     filterset_class = ProductFilter
     strict = False
+    canonical_defaults = CATALOG_QUERY_DEFAULTS
 
     def get_queryset(self):
-        queryset = super().get_queryset()
+        queryset = super().get_queryset().with_main_image()
         category = self.get_current_category()
 
         if category:
             queryset = queryset.filter(
-                category__in=category.get_descendants(include_self=True)
+                category_id__in=get_category_tree().descendant_ids(category.id)
             )
 
         return queryset
 
-    def get_filterset_kwargs(self, filterset_class):
-        kwargs = super().get_filterset_kwargs(filterset_class)
-        # Удаляем передачу категории в фильтр
-        return kwargs
+    def get_snapshot(self):
+        """Снимок категории в памяти, если он включен и может ответить на запрос"""
+        if not hasattr(self, '_snapshot'):
+            self._snapshot = None
+            category = self.get_current_category()
+            if category and is_snapshot_enabled(category) and not self.is_cursor_mode():
+                snapshot = get_category_snapshot(category.id)
+                if snapshot.supports(self.request.GET) and snapshot.supports_ordering(self.get_sort_ordering()):
+                    self._snapshot = snapshot
+        return self._snapshot
+
+    def get_filter_values(self):
+        return self.filterset.form.cleaned_data if self.filterset.is_bound else {}
+
+    def paginate_queryset(self, queryset, page_size):
+        snapshot = self.get_snapshot()
+        if snapshot is None:
+            return super().paginate_queryset(queryset, page_size)
+
+        # Фильтры и сортировка по снимку, из базы - только товары страницы
+        ids = snapshot.select(self.get_filter_values(), self.get_sort_ordering())
+        paginator = SnapshotPaginator(ids, page_size, self.filterset.queryset)
+        try:
+            page = paginator.page(self.request.GET.get(self.page_kwarg) or 1)
+        except InvalidPage:
+            raise Http404(_("Неверная страница"))
+        return paginator, page, page.object_list, page.has_other_pages()
+
+    def get_filterset_class(self):
+        # Атрибутные фильтры категории - готовый класс из кэша процесса
+        category = self.get_current_category()
+        if category:
+            return self.filterset_class.for_category(category.id)
+        return self.filterset_class
 
     def get_current_category(self):
-        category_slug = self.kwargs.get('category_slug')
-        if category_slug:
-            return get_object_or_404(Category, slug=category_slug)
-        return None
+        if not hasattr(self, '_current_category'):
+            category_slug = self.kwargs.get('category_slug')
+            self._current_category = (
+                get_object_or_404(Category, slug=category_slug) if category_slug else None
+            )
+        return self._current_category
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        category = self.get_current_category()
         context.update({
-            'category': self.get_current_category(),
+            'category': category,
             'sort_options': self.get_sort_options(),
-            'result_count': self.get_queryset().count(),
-            'category_tree': self.get_cached_category_tree()
+            'category_tree': get_category_tree().roots,
+            'facets': self.get_facets(category) if category else None,
         })
         return context
 
+    def get_facets(self, category):
+        snapshot = self.get_snapshot()
+        if snapshot is not None:
+            return snapshot.facets(self.get_filter_values(), self.request.GET)
+        return get_facets(
+            type(self.filterset),
+            self.request.GET,
+            self.filterset.queryset,
+            category.id,
+            self.request.path
+        )
+
     def get_sort_options(self):
         return [
             {'key': 'default', 'label': _('По умолчанию')},
@@ -65,33 +139,52 @@ class ProductListView(FilterView):
             {'key': 'top_rated', 'label': _('Рейтинг')}
         ]
 
-    def get_cached_category_tree(self):
-        cache_key = 'category_tree'
-        category_tree = cache.get(cache_key)
-        if not category_tree:
-            category_tree = Category.objects.filter(level=0).get_descendants(
-                include_self=True).annotate(product_count=Count('products'))
-            cache.set(cache_key, category_tree, 3600)
-        return category_tree
+    def get_page_cache_namespaces(self):
+        # Категория по дереву из кэша: попадание в кэш страниц обходится без запросов
+        category = get_category_tree().get_by_slug(self.kwargs.get('category_slug'))
+        return (
+            catalog_namespace(category['id'] if category else None),
+            CATEGORY_TREE_NAMESPACE,
+            SCHEMA_NAMESPACE,
+        )
 
-    @method_decorator(cache_page(60 * 15))
-    @method_decorator(vary_on_cookie)
-    def dispatch(self, *args, **kwargs):
-        return super().dispatch(*args, **kwargs)
+    def get_etag_parts(self):
+        return catalog_etag_parts(self)
 
 
-class ProductDetailView(DetailView):
+class ProductDetailView(ConditionalPageMixin, DetailView):
     model = Product
     template_name = 'products/product_detail.html'
     context_object_name = 'product'
     slug_url_kwarg = 'product_slug'
 
+    def get_etag_parts(self):
+        # Выборки по индексам вместо рендера: товар, отзывы, категория, характеристики ветви,
+        # дерево и показанные похожие товары - их состав и версии карточек (цена, фото, наличие)
+        product = Product.objects.filter(slug=self.kwargs[self.slug_url_kwarg]).values(
+            'pk', 'category_id'
+        ).first()
+        if product is None:
+            return None
+        related_ids = list(
+            RelatedProduct.objects.filter(product_id=product['pk']).order_by('rank').values_list(
+                'related_id', flat=True
+            )[:RELATED_PRODUCTS_SHOWN]
+        )
+        return [product['pk'], related_ids, get_versions([
+            card_namespace(product['pk']),
+            reviews_namespace(product['pk']),
+            catalog_namespace(product['category_id']),
+            spec_sheet_namespace(product['category_id']),
+            CATEGORY_TREE_NAMESPACE,
+            *(card_namespace(pk) for pk in related_ids),
+        ])]
+
     def get_queryset(self):
         return super().get_queryset().select_related(
             'category'
         ).prefetch_related(
             Prefetch('images', queryset=ProductImage.objects.order_by('-is_main')),
-            Prefetch('attributes__attribute__groups'),  # Используйте Prefetch для groups
         )
 
     def get_context_data(self, **kwargs):
@@ -105,7 +198,7 @@ class ProductDetailView(DetailView):
         ).select_related('user')
 
         context.update({
-            'grouped_attributes': self.get_grouped_attributes(product),
+            'spec_sheet': get_spec_sheet(product),
             'related_products': self.get_related_products(product),
             'sku': product.sku,
             'is_digital': product.is_digital,
@@ -113,48 +206,52 @@ class ProductDetailView(DetailView):
         })
         return context
 
-    def get_grouped_attributes(self, product):
-        # Замените select_related на prefetch_related для ManyToMany-связи
-        attributes = product.attributes.select_related('attribute').prefetch_related(
-            'attribute__groups',  # Если groups — ManyToManyField
-            'attribute__enum_options'
-        )
-
-        grouped = {}
-        for attr in attributes:
-            # Используйте attribute.groups.all() для доступа к группам
-            for group in attr.attribute.groups.all():
-                grouped.setdefault(group, []).append(attr)
-        return sorted(grouped.items(), key=lambda x: x[0].name)
-
     def get_related_products(self, product):
+        # Предрасчитанные соседи (apps.products.related), один запрос по индексу (product, rank)
         return Product.objects.filter(
-            category=product.category
-        ).exclude(id=product.id).order_by('?')[:4]
+            related_from__product=product
+        ).order_by('related_from__rank').with_main_image()[:RELATED_PRODUCTS_SHOWN]
 
 
-class SearchView(ListView):
+class SearchView(CanonicalQueryMixin, ConditionalPageMixin, SharedPageCacheMixin, KeysetPaginationMixin, ListView):
     model = Product
     template_name = 'products/search_results.html'
     context_object_name = 'products'
     paginate_by = 12
+    canonical_defaults = CATALOG_QUERY_DEFAULTS
+    # По умолчанию - по релевантности (ts_rank)
+    sort_orderings = {**SORT_ORDERINGS, 'default': ('-rank', '-id')}
+
+    def get_page_cache_namespaces(self):
+        return (CATALOG_NAMESPACE,)
+
+    def get_etag_parts(self):
+        return catalog_etag_parts(self)
 
     def get_queryset(self):
         query = self.request.GET.get('q', '')
         if query:
-            return Product.objects.filter(
-                Q(name__icontains=query) |
-                Q(sku__iexact=query) |
-                Q(description__icontains=query)
-            ).distinct().select_related('category').prefetch_related('images')
+            return search_products(
+                Product.objects.select_related('category').with_main_image(),
+                query
+            )
         return Product.objects.none()
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['query'] = self.request.GET.get('q', '')
-        context['result_count'] = self.get_queryset().count()
+        context['sort_options'] = self.get_sort_options()
         return context
 
+    def get_sort_options(self):
+        return [
+            {'key': 'default', 'label': _('По релевантности')},
+            {'key': 'price_asc', 'label': _('Цена ↑')},
+            {'key': 'price_desc', 'label': _('Цена ↓')},
+            {'key': 'newest', 'label': _('Новинки')},
+            {'key': 'top_rated', 'label': _('Рейтинг')}
+        ]
+
 
 class AddReviewView(LoginRequiredMixin, View):
     def post(self, request, product_id):
@@ -175,3 +272,39 @@ class AddReviewView(LoginRequiredMixin, View):
             'success': True,
             'message': 'Отзыв отправлен на модерацию.'
         })
+
+
+class AutocompleteView(View):
+    """JSON-подсказки для строки поиска"""
+
+    def get(self, request):
+        try:
+            limit = int(request.GET.get('limit', AUTOCOMPLETE_LIMIT))
+        except ValueError:
+            limit = AUTOCOMPLETE_LIMIT
+        return JsonResponse(autocomplete(request.GET.get('q', ''), limit))
+
+
+class CatalogFeedView(View):
+    """Потоковая выгрузка каталога: CSV, JSONL или YML (apps.products.export)"""
+
+    def get(self, request, format):
+        token = settings.CATALOG_FEED_TOKEN
+        if not request.user.is_staff and not (token and constant_time_compare(request.GET.get('token', ''), token)):
+            raise Http404
+        if format not in EXPORT_FORMATS:
+            raise Http404
+
+        category_id = None
+        if request.GET.get('category'):
+            node = get_category_tree().get_by_slug(request.GET['category'])
+            if node is None:
+                raise Http404(_("Категория не найдена"))
+            category_id = node['id']
+
+        response = StreamingHttpResponse(
+            export_feed(format, category_id, request.build_absolute_uri('/')),
+            content_type=EXPORT_FORMATS[format]
+        )
+        response['Content-Disposition'] = f'attachment; filename="catalog.{EXPORT_EXTENSIONS[format]}"'
+        return response
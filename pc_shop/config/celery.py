@@ -0,0 +1,15 @@
+"""
+Celery app for pc_shop.
+
+Worker: celery -A config worker -l info
+"""
+
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+app = Celery('pc_shop')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
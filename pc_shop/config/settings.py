@@ -23,6 +23,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.contrib.humanize',
+    'django.contrib.postgres',
 
     # Local apps
     'apps.core.apps.CoreConfig',
@@ -86,6 +87,35 @@ DATABASES = {
     }
 }
 
+# Общий кэш нужен, чтобы инвалидация по версиям была видна всем процессам;
+# без REDIS_URL используется локальный кэш процесса (разработка)
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+
+# Брокер фоновых задач (миниатюры, снятие истекших резервов); по умолчанию - тот же Redis.
+# Без брокера задачи выполняются синхронно в процессе, который их поставил
+CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', os.getenv('REDIS_URL', ''))
+CELERY_TASK_ALWAYS_EAGER = not CELERY_BROKER_URL
+CELERY_BEAT_SCHEDULE = {
+    'release-abandoned-carts': {
+        'task': 'apps.cart.tasks.release_abandoned_carts',
+        'schedule': 15 * 60,
+    },
+}
+
+# Категории, фильтруемые по столбцовому снимку в памяти (apps.products.snapshot, нужен NumPy)
+CATALOG_SNAPSHOT_CATEGORIES = [
+    slug for slug in os.getenv('CATALOG_SNAPSHOT_CATEGORIES', '').split(',') if slug
+]
+
+# Токен выгрузки фида каталога для маркетплейсов (?token=); без него фид доступен только персоналу
+CATALOG_FEED_TOKEN = os.getenv('CATALOG_FEED_TOKEN', '')
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.urls import path, include
-from apps.core.views import home
+from apps.core.views import home, user_state
 from django.conf import settings
 from django.conf.urls.static import static
 
@@ -10,6 +10,7 @@ urlpatterns = [
 
     # MAIN
     path('', home, name='home'),
+    path('state/', user_state, name='user_state'),
 
     # APPS
     path('accounts/', include('accounts.urls')),
@@ -39,6 +39,58 @@ const GlobalHandlers = {
                 Utils.showNotification('Ошибка соединения', 'danger');
             }
         });
+    },
+
+    initSearchAutocomplete() {
+        const input = document.querySelector('input[data-autocomplete-url]');
+        if (!input) return;
+
+        const datalist = document.getElementById(input.getAttribute('list'));
+        let timer = null;
+
+        input.addEventListener('input', () => {
+            clearTimeout(timer);
+            const query = input.value.trim();
+            if (query.length < 2) return;
+
+            timer = setTimeout(async () => {
+                try {
+                    const url = `${input.dataset.autocompleteUrl}?q=${encodeURIComponent(query)}`;
+                    const data = await (await fetch(url)).json();
+                    datalist.innerHTML = '';
+                    [...data.products.map(p => p.name), ...data.categories.map(c => c.name)].forEach(value => {
+                        const option = document.createElement('option');
+                        option.value = value;
+                        datalist.appendChild(option);
+                    });
+                } catch (error) {
+                    datalist.innerHTML = '';
+                }
+            }, 150);
+        });
+    },
+
+    // Страницы каталога отдаются из общего кэша: персональное состояние - отдельным запросом
+    async initUserState() {
+        const url = document.body.dataset.userStateUrl;
+        if (!url) return;
+
+        try {
+            const state = await (await fetch(url, {credentials: 'same-origin'})).json();
+            document.querySelectorAll('[data-cart-count]').forEach(badge => {
+                badge.firstChild.textContent = state.cart_count;
+            });
+            const mark = (selector, ids) => {
+                const active = new Set(ids.map(String));
+                document.querySelectorAll(selector).forEach(btn => {
+                    btn.classList.toggle('active', active.has(btn.dataset.productId));
+                });
+            };
+            mark('.add-to-wishlist', state.wishlist);
+            mark('.add-to-compare', state.compare);
+        } catch (error) {
+            // Без персональных данных страница остается рабочей
+        }
     }
 };
 
@@ -47,4 +99,6 @@ const GlobalHandlers = {
 document.addEventListener('DOMContentLoaded', () => {
     GlobalHandlers.initWishlist();
     GlobalHandlers.initCompare();
+    GlobalHandlers.initSearchAutocomplete();
+    GlobalHandlers.initUserState();
 });
\ No newline at end of file